@@ -1,40 +1,62 @@
 import os
 import requests
 import logging
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from flask_session import Session
+from flask import Flask, render_template, request, redirect, url_for, session, flash, g
 from functools import wraps
 from dotenv import load_dotenv
-import jwt
+from common.auth import TokenVerifier
+from common.logs import setup_logging, init_request_logging
+from common.metrics import init_metrics
+from common.tracing import init_tracing, span
+from common.health import init_health
+from sessions import init_sessions
+from upstream import UpstreamClient, fan_out
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'dev-key-change-in-prod'
-app.config['SESSION_TYPE'] = 'filesystem'
-Session(app)
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-prod')  # Must match across gateway replicas
 
-logging.basicConfig(level=logging.DEBUG)
+setup_logging('gateway')  # JSON lines via a background queue listener; LOG_LEVEL etc. in common/logs.py
+init_request_logging(app)
+init_metrics(app, 'gateway')  # GET /metrics; upstream call timings are recorded in upstream.py
+init_tracing(app)  # X-Request-ID + Server-Timing; upstream.py forwards the id and merges the services' timings
+init_health(app)  # /healthz, /readyz for container healthchecks
 logger = logging.getLogger(__name__)
 
+init_sessions(app)  # SESSION_BACKEND=cookie|store, see sessions.py
+
 JWT_SECRET = os.getenv('JWT_SECRET')
-AUTH_SERVICE_URL = 'http://auth-service:5002'
-BOOK_SERVICE_URL = 'http://book-service:5001'
-BORROW_SERVICE_URL = 'http://borrow-service:5003'
+AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://auth-service:5002')
+BOOK_SERVICE_URL = os.getenv('BOOK_SERVICE_URL', 'http://book-service:5001')
+BORROW_SERVICE_URL = os.getenv('BORROW_SERVICE_URL', 'http://borrow-service:5003')
+
+# Book columns each template actually renders (book-service defers everything else)
+BOOK_CARD_FIELDS = 'id,title,author,bio_excerpt,image_url,available'
+ADMIN_BOOK_FIELDS = 'id,title,author,available'
+
+# Pooled keep-alive clients, one per upstream service (see upstream.py)
+auth_api = UpstreamClient('auth-service', AUTH_SERVICE_URL)
+book_api = UpstreamClient('book-service', BOOK_SERVICE_URL)
+borrow_api = UpstreamClient('borrow-service', BORROW_SERVICE_URL)
+token_verifier = TokenVerifier(JWT_SECRET)
+
+def current_user():
+    # Claims of the session's token, verified once per request; the session itself only stores the token
+    if 'user' not in g:
+        token = session.get('token')
+        with span('auth'):
+            g.user = token_verifier.verify(token) if token else None  # Cached until exp, so page loads skip the HMAC check
+    return g.user
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = session.get('token')
-        if not token:
+        if not session.get('token'):
             flash('Authentication required')
             return redirect(url_for('signin'))
-        try:
-            decoded = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-            session['user_id'] = decoded['user_id']
-            session['username'] = decoded['username']
-            session['role'] = decoded['role']
-        except jwt.InvalidTokenError:
+        if not current_user():
+            session.pop('token', None)  # Expired or tampered: drop it so the next page starts clean
             flash('Invalid token')
             return redirect(url_for('signin'))
         return f(*args, **kwargs)
@@ -43,15 +65,15 @@ def token_required(f):
 def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        if session.get('role') != 'admin':
+        if current_user().get('role') != 'admin':
             flash('Admin access required')
             return redirect(url_for('books'))
         return f(*args, **kwargs)
     return decorated
 
 @app.context_processor
-def inject_session():
-    return dict(session=session)
+def inject_user():
+    return dict(current_user=current_user())
 
 @app.route('/')
 def index():
@@ -64,7 +86,7 @@ def signin():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        response = requests.post(f'{AUTH_SERVICE_URL}/login', json={'username': username, 'password': password})
+        response = auth_api.post('/login', json={'username': username, 'password': password})
         logger.info(f"Login attempt for {username}: {response.status_code}")
         if response.status_code == 200:
             data = response.json()
@@ -82,7 +104,7 @@ def signup():
         username = request.form['username']
         password = request.form['password']
         role = request.form['role']
-        response = requests.post(f'{AUTH_SERVICE_URL}/signup', json={'username': username, 'password': password, 'role': role})
+        response = auth_api.post('/signup', json={'username': username, 'password': password, 'role': role})
         logger.info(f"Signup attempt for {username} (role: {role}): {response.status_code}")
         if response.status_code == 201:
             logger.info(f"User        {username} signed up with role {role}")
@@ -95,27 +117,42 @@ def signup():
 @app.route('/books')
 @token_required
 def books():
-    user_id = session['user_id']
+    user_id = g.user['user_id']
+    q = request.args.get('q', '').strip()
+    after = request.args.get('after', type=int)  # Keyset cursor: last book id of the previous page
+    offset = request.args.get('offset', 0, type=int)  # Search results are ranked, so they page by offset
     headers = {'Authorization': f'Bearer {session["token"]}'}
+    next_page_url = None
     try:
-        response = requests.get(f'{BOOK_SERVICE_URL}/books', headers=headers, params={'user_id': user_id}, timeout=10)
-        logger.info(f"Books request for user {user_id}: {response.status_code} - {response.text[:100]}...")
-        response.raise_for_status()
-        books_data = response.json().get('books', [])
+        # get_json revalidates with If-None-Match, so unchanged pages come back as a bodiless 304
+        if q:
+            books_page = book_api.get_json('/books/search', cache_scope=user_id, headers=headers, params={'q': q, 'offset': offset, 'fields': BOOK_CARD_FIELDS})
+        else:
+            params = {'user_id': user_id, 'fields': BOOK_CARD_FIELDS}
+            if after:
+                params['after'] = after
+            books_page = book_api.get_json('/books', cache_scope=user_id, headers=headers, params=params)
+        books_data = books_page.get('books', [])
+        logger.info(f"Books request for user {user_id}: {len(books_data)} books")
+        if books_page.get('next_offset') is not None:
+            next_page_url = url_for('books', q=q, offset=books_page['next_offset'])
+        elif books_page.get('next_cursor'):
+            next_page_url = url_for('books', after=books_page['next_cursor'])
     except requests.exceptions.RequestException as e:
         flash(f'Failed to load books: {str(e)}')
         books_data = []
         logger.error(f"Failed to load books: {str(e)}")
-    return render_template('books.html', books=books_data)
+    first_page_url = None
+    if after or offset:
+        first_page_url = url_for('books', q=q) if q else url_for('books')
+    return render_template('books.html', books=books_data, q=q, next_page_url=next_page_url, first_page_url=first_page_url)
 
 @app.route('/book/<int:book_id>')
 @token_required
 def book_details(book_id):
     headers = {'Authorization': f'Bearer {session["token"]}'}
     try:
-        response = requests.get(f'{BOOK_SERVICE_URL}/books/{book_id}', headers=headers, timeout=10)
-        response.raise_for_status()
-        book_data = response.json().get('book')
+        book_data = book_api.get_json(f'/books/{book_id}', cache_scope=g.user['user_id'], headers=headers).get('book')
         
         if not book_data:
             flash('Book not found')
@@ -133,11 +170,14 @@ def book_details(book_id):
 @app.route('/borrow/<int:book_id>', methods=['POST'])
 @token_required
 def borrow_book(book_id):
-    user_id = session['user_id']
+    user_id = g.user['user_id']
     headers = {'Authorization': f'Bearer {session["token"]}'}
     try:
-        response = requests.post(f'{BORROW_SERVICE_URL}/borrow', json={'user_id': user_id, 'book_id': book_id}, headers=headers, timeout=10)
+        response = borrow_api.post('/borrow', json={'user_id': user_id, 'book_id': book_id}, headers=headers)
         logger.info(f"Borrow request for user {user_id}, book {book_id}: {response.status_code}")
+        if response.status_code in (404, 409, 503):  # Not found / someone else got it first / busy
+            flash('Borrow failed: ' + response.json().get('error', 'Book not available'))
+            return redirect(url_for('books'))
         response.raise_for_status()
         flash('Book borrowed successfully')
     except requests.exceptions.RequestException as e:
@@ -145,15 +185,35 @@ def borrow_book(book_id):
         logger.error(f"Borrow failed: {str(e)}")
     return redirect(url_for('books'))
 
+@app.route('/borrow/batch', methods=['POST'])
+@token_required
+def borrow_batch():
+    user_id = g.user['user_id']
+    book_ids = request.form.getlist('book_ids', type=int)
+    if not book_ids:
+        flash('Select at least one book to borrow')
+        return redirect(url_for('books'))
+    headers = {'Authorization': f'Bearer {session["token"]}'}
+    try:
+        response = borrow_api.post('/borrow/batch', json={'user_id': user_id, 'book_ids': book_ids}, headers=headers)
+        logger.info(f"Batch borrow request for user {user_id}, books {book_ids}: {response.status_code}")
+        response.raise_for_status()
+        result = response.json()
+        skipped = [str(r['book_id']) for r in result.get('results', []) if r['status'] != 'borrowed']
+        flash(f"Borrowed {result.get('borrowed', 0)} of {len(book_ids)} books" +
+              (f" (not available: {', '.join(skipped)})" if skipped else ''))
+    except requests.exceptions.RequestException as e:
+        flash('Batch borrow failed: ' + str(e))
+        logger.error(f"Batch borrow failed: {str(e)}")
+    return redirect(url_for('books'))
+
 @app.route('/borrowed')
 @token_required
 def borrowed():
     headers = {'Authorization': f'Bearer {session["token"]}'}
     try:
-        response = requests.get(f'{BORROW_SERVICE_URL}/borrowed', headers=headers, timeout=10)
-        logger.info(f"Borrowed books request: {response.status_code}")
-        response.raise_for_status()
-        borrowed_data = response.json()
+        borrowed_data = borrow_api.get_json('/borrowed', cache_scope=g.user['user_id'], headers=headers)
+        logger.info(f"Borrowed books request: {len(borrowed_data.get('borrowed_books', []))} books")
     except requests.exceptions.RequestException as e:
         flash('Failed to load borrowed books: ' + str(e))
         borrowed_data = {'borrowed_books': []}
@@ -165,7 +225,7 @@ def borrowed():
 def return_book(borrow_id):
     headers = {'Authorization': f'Bearer {session["token"]}'}
     try:
-        response = requests.post(f'{BORROW_SERVICE_URL}/return/{borrow_id}', headers=headers, timeout=10)
+        response = borrow_api.post(f'/return/{borrow_id}', headers=headers)
         logger.info(f"Return request for borrow {borrow_id}: {response.status_code}")
         response.raise_for_status()
         flash('Book returned successfully')
@@ -174,42 +234,75 @@ def return_book(borrow_id):
         logger.error(f"Return failed: {str(e)}")
     return redirect(url_for('borrowed'))
 
+@app.route('/return/batch', methods=['POST'])
+@token_required
+def return_batch():
+    borrow_ids = request.form.getlist('borrow_ids', type=int)
+    if not borrow_ids:
+        flash('Select at least one book to return')
+        return redirect(url_for('borrowed'))
+    headers = {'Authorization': f'Bearer {session["token"]}'}
+    try:
+        response = borrow_api.post('/return/batch', json={'borrow_ids': borrow_ids}, headers=headers)
+        logger.info(f"Batch return request for borrows {borrow_ids}: {response.status_code}")
+        response.raise_for_status()
+        flash(f"Returned {response.json().get('returned', 0)} of {len(borrow_ids)} books")
+    except requests.exceptions.RequestException as e:
+        flash('Batch return failed: ' + str(e))
+        logger.error(f"Batch return failed: {str(e)}")
+    return redirect(url_for('borrowed'))
+
 @app.route('/admin')
 @token_required
 @admin_required
 def admin():
     headers = {'Authorization': f'Bearer {session["token"]}'}
-    books_data = []
-    users_data = []
-    borrows_data = []
-    try:
-        book_response = requests.get(f'{BOOK_SERVICE_URL}/books/all', headers=headers, timeout=10)
-        book_response.raise_for_status()
-        books_data = book_response.json().get('books', [])
-        logger.info(f"Admin loaded {len(books_data)} all books")
-    except requests.exceptions.RequestException as e:
-        flash(f'Failed to load books: {str(e)}')
-        logger.error(f"Admin failed to load all books: {str(e)}")
+    user_id = g.user['user_id']
+    books_after = request.args.get('books_after', type=int)  # Keyset cursor for the books table
+    book_params = {'fields': ADMIN_BOOK_FIELDS}
+    if books_after:
+        book_params['after'] = books_after
+    borrows_after = request.args.get('borrows_after')  # Keyset cursor for the borrows ledger
+    # Ledger filters are passed straight through to borrow-service, which validates them
+    borrow_filters = {key: request.args[f'borrows_{key}'] for key in ('user_id', 'book_id', 'from', 'to')
+                      if request.args.get(f'borrows_{key}')}
+    borrow_params = dict(borrow_filters)
+    if borrows_after:
+        borrow_params['after'] = borrows_after
+    # Users: keyset on username, optional prefix search and role filter (auth-service validates)
+    user_params = {key: request.args[f'users_{key}'] for key in ('after', 'q', 'role') if request.args.get(f'users_{key}')}
 
-    try:
-        user_response = requests.get(f'{AUTH_SERVICE_URL}/users', headers=headers, timeout=10)
-        user_response.raise_for_status()
-        users_data = user_response.json().get('users', [])
-        logger.info(f"Admin loaded {len(users_data)} users")
-    except requests.exceptions.RequestException as e:
-        flash(f'Failed to load users: {str(e)}')
-        logger.error(f"Admin failed to load users: {str(e)}")
+    def load(api, path, params=None):
+        return api.get_json(path, cache_scope=user_id, headers=headers, params=params)
 
-    try:
-        borrow_response = requests.get(f'{BORROW_SERVICE_URL}/borrows/all', headers=headers, timeout=10)
-        borrow_response.raise_for_status()
-        borrows_data = borrow_response.json().get('borrows', [])
-        logger.info(f"Admin loaded {len(borrows_data)} borrows")
-    except requests.exceptions.RequestException as e:
-        flash(f'Failed to load borrows: {str(e)}')
-        logger.error(f"Admin failed to load borrows: {str(e)}")
+    # The three services are independent, so fetch them concurrently under one deadline
+    results = fan_out({
+        'books': lambda: load(book_api, '/books/all', book_params),
+        'users': lambda: load(auth_api, '/users', user_params),
+        'borrows': lambda: load(borrow_api, '/borrows/all', borrow_params),
+    })
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            flash(f'Failed to load {name}: {str(result)}')
+            logger.error(f"Admin failed to load {name}: {str(result)}")
+            results[name] = {}
+        else:
+            logger.info(f"Admin loaded {len(result.get(name, []))} {name}")
+    books_data = results['books'].get('books', [])
+    users_data = results['users'].get('users', [])
+    borrows_data = results['borrows'].get('borrows', [])
+
+    return render_template('admin.html', books=books_data, users=users_data, borrows=borrows_data, current_user_id=g.user['user_id'],
+                           books_next_cursor=results['books'].get('next_cursor'), books_is_first_page=not books_after,
+                           users_next_cursor=results['users'].get('next_cursor'), users_is_first_page='after' not in user_params,
+                           borrows_next_cursor=results['borrows'].get('next_cursor'), borrows_is_first_page=not borrows_after)
 
-    return render_template('admin.html', books=books_data, users=users_data, borrows=borrows_data, current_user_id=session['user_id'])
+@app.template_global()
+def admin_page_url(drop_prefix=None, **changes):
+    # Link to the admin page that changes one section's paging/filters and keeps the other sections' state
+    args = {key: value for key, value in request.args.items() if not (drop_prefix and key.startswith(drop_prefix))}
+    args.update(changes)
+    return url_for('admin', **{key: value for key, value in args.items() if value not in (None, '')})
 
 @app.route('/admin/users', methods=['GET', 'POST'])
 @token_required
@@ -222,7 +315,7 @@ def manage_users():
         headers = {'Authorization': f'Bearer {session["token"]}'}
         data = {'username': username, 'password': password, 'role': role}
         try:
-            response = requests.post(f'{AUTH_SERVICE_URL}/users', json=data, headers=headers, timeout=10)
+            response = auth_api.post('/users', json=data, headers=headers)
             logger.info(f"Admin create user '{username}' (role: {role}): {response.status_code}")
             response.raise_for_status()
             flash('User    created successfully')
@@ -239,12 +332,12 @@ def manage_users():
 @token_required
 @admin_required
 def delete_user_proxy(user_id):
-    if session['user_id'] == user_id:
+    if g.user['user_id'] == user_id:
         flash('Cannot delete your own account')
         return redirect(url_for('admin'))
     headers = {'Authorization': f'Bearer {session["token"]}'}
     try:
-        response = requests.delete(f'{AUTH_SERVICE_URL}/users/{user_id}', headers=headers, timeout=10)
+        response = auth_api.delete(f'/users/{user_id}', headers=headers)
         logger.info(f"Admin delete user {user_id}: {response.status_code}")
         response.raise_for_status()
         flash('User    deleted successfully')
@@ -275,7 +368,7 @@ def add_book_page():
             'book_url': book_url
         }
         try:
-            response = requests.post(f'{BOOK_SERVICE_URL}/books', json=data, headers=headers, timeout=10)
+            response = book_api.post('/books', json=data, headers=headers)
             logger.info(f"Add book '{title}': {response.status_code}")
             response.raise_for_status()
             flash('Book added successfully')
@@ -311,7 +404,7 @@ def edit_book_page(book_id):
         }
         
         try:
-            response = requests.put(f'{BOOK_SERVICE_URL}/books/{book_id}', json=data, headers=headers, timeout=10)
+            response = book_api.put(f'/books/{book_id}', json=data, headers=headers)
             logger.info(f"Update book {book_id}: {response.status_code}")
             response.raise_for_status()
             flash('Book updated successfully')
@@ -322,18 +415,12 @@ def edit_book_page(book_id):
     
     # GET request - load existing book data
     try:
-        # Get all books to find the specific one
-        response = requests.get(f'{BOOK_SERVICE_URL}/books/all', headers=headers, timeout=10)
-        response.raise_for_status()
-        all_books = response.json().get('books', [])
-        
-        # Find the specific book by ID
-        book = next((b for b in all_books if b['id'] == book_id), None)
-        
-        if not book:
+        response = book_api.get(f'/books/{book_id}', headers=headers)
+        if response.status_code == 404:
             flash('Book not found')
             return redirect(url_for('admin'))
-            
+        response.raise_for_status()
+        book = response.json().get('book')
         return render_template('edit-book.html', book=book)
         
     except requests.exceptions.RequestException as e:
@@ -347,7 +434,7 @@ def edit_book_page(book_id):
 def delete_book(book_id):
     headers = {'Authorization': f'Bearer {session["token"]}'}
     try:
-        response = requests.delete(f'{BOOK_SERVICE_URL}/books/{book_id}', headers=headers, timeout=10)
+        response = book_api.delete(f'/books/{book_id}', headers=headers)
         logger.info(f"Delete book {book_id}: {response.status_code}")
         response.raise_for_status()
         flash('Book deleted successfully')
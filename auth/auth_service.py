@@ -1,25 +1,54 @@
 import os
 import logging
+import csv
 import time
-from flask import Flask, request, jsonify
+import click
+import unicodedata
+from flask import Flask, request, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from sqlalchemy.exc import OperationalError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+from sqlalchemy.orm import load_only
+from common.auth import TokenAuth
+from passwords import MAX_PASSWORD_BYTES, PasswordHasherBusy, hash_password, hash_passwords, needs_rehash, password_too_long, verify_password
+from common.bulk import iter_bulk_rows
+from common.loans import archive_closed_loans, open_loan_count
+from common.export import export_format, export_response
+from common.db import database_uri, engine_options, init_db_pool
+from common.logs import setup_logging, init_request_logging
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.health import init_health
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}?charset=utf8mb4'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()  # DB_HOST, DB_USER, ... or DATABASE_URL: common/db.py
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('AUTH')  # Pool size, pre-ping, recycle: common/db.py
 db = SQLAlchemy(app)
 
-logging.basicConfig(level=logging.DEBUG)
+setup_logging('auth-service')
+init_request_logging(app)
+init_metrics(app, 'auth-service', db)
+init_tracing(app)
+init_health(app, db)
 logger = logging.getLogger(__name__)
 
 JWT_SECRET = os.getenv('JWT_SECRET')
+auth = TokenAuth(JWT_SECRET, unauthorized_status=422, admin_error='Admin role required')  # Verified-token cache per worker
+init_db_pool(app, db, auth.require_admin)  # 503 when no connection is free within the pool timeout; GET /debug/pool
+BULK_BATCH_SIZE = int(os.getenv('USERS_BULK_BATCH_SIZE', '1000'))
+MAX_BULK_BATCH_SIZE = 10000
+ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')  # Sample admin created by `flask create-admin`
+ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'adminpass')
+USERNAME_MAX_LENGTH = 80  # users.username VARCHAR(80)
+MIN_PASSWORD_LENGTH = 6
+USERS_PAGE_SIZE = int(os.getenv('USERS_PAGE_SIZE', '50'))
+MAX_USERS_PAGE_SIZE = 200
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -28,38 +57,28 @@ class User(db.Model):
     password_hash = db.Column(db.String(120), nullable=False)
     role = db.Column(db.String(20), default='user')
 
+    # Hashing runs in the passwords.py process pool and may raise PasswordHasherBusy (answered with 503)
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-def get_user_from_token(token):
-    try:
-        decoded = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        logger.debug(f"Token decoded: user_id={decoded.get('user_id')}, role={decoded.get('role')}")
-        return decoded
-    except jwt.InvalidTokenError as e:
-        logger.warning(f"Invalid token: {str(e)}")
-        return None
-    except jwt.ExpiredSignatureError:
-        logger.warning("Token expired")
-        return None
+        return verify_password(password, self.password_hash)
 
 def create_sample_admin(max_retries=10, base_delay=2):
+    # Returns True once the admin exists; runs from `flask create-admin` (one-shot auth-bootstrap), not per worker
     for attempt in range(1, max_retries + 1):
         try:
             with app.app_context():
-                admin_user = User.query.filter_by(username='admin').first()
+                admin_user = User.query.filter_by(username=ADMIN_USERNAME).first()
                 if admin_user:
                     logger.info("Sample admin user already exists—skipping creation.")
-                    return
-                admin = User(username='admin', role='admin')
-                admin.set_password('adminpass')
+                    return True
+                admin = User(username=ADMIN_USERNAME, role='admin')
+                admin.set_password(ADMIN_PASSWORD)
                 db.session.add(admin)
                 db.session.commit()
-                logger.info("Sample admin user created on startup: admin / adminpass")
-                return
+                logger.info(f"Sample admin user created: {ADMIN_USERNAME}")
+                return True
         except OperationalError as e:
             if "Can't connect to MySQL server" in str(e) or "Connection refused" in str(e):
                 logger.warning(f"Retrying DB connection for admin creation (attempt {attempt}/{max_retries})")
@@ -69,17 +88,23 @@ def create_sample_admin(max_retries=10, base_delay=2):
                 raise
         except Exception as e:
             logger.warning(f"Failed to create sample admin (may already exist or DB issue): {str(e)}")
-            return
+            return False
     
     logger.error(f"Failed to create sample admin after {max_retries} retries—DB may not be ready. Manual creation needed.")
+    return False
 
-create_sample_admin()
+@app.cli.command('create-admin')
+@click.option('--max-retries', default=10, show_default=True, help='Database connection attempts before giving up')
+def create_admin(max_retries):
+    """Create the sample admin user if it does not exist yet (once per deployment)."""
+    if not create_sample_admin(max_retries=max_retries):
+        raise SystemExit(1)  # Non-zero so the one-shot service is retried / reported as failed
 
-@app.before_request
-def log_request():
-    logger.debug(f"Auth request: {request.method} {request.url}")
-    logger.debug(f"Headers: {dict(request.headers)}")
-    logger.debug(f"Body: {request.get_json(silent=True) or {}}")
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    # Shed load during a login storm instead of queueing requests behind the hashing pool
+    logger.warning(f"{request.endpoint}: {str(e)} - Returning 503")
+    return jsonify({'error': 'Too many sign-ins in progress, please retry'}), 503, {'Retry-After': '1'}
 
 @app.route('/signup', methods=['POST'])
 def signup():
@@ -94,6 +119,9 @@ def signup():
     if data['role'] not in ['user', 'admin']:
         logger.warning(f"Signup: Invalid role {data['role']}")
         return jsonify({'error': 'Role must be user or admin'}), 422
+    if password_too_long(data['password']):
+        logger.warning(f"Signup: Password for {username} longer than {MAX_PASSWORD_BYTES} bytes")
+        return jsonify({'error': f'Password must be at most {MAX_PASSWORD_BYTES} bytes'}), 422
     user = User(username=username, role=data['role'])
     user.set_password(data['password'])
     db.session.add(user)
@@ -110,6 +138,15 @@ def login():
     username = data['username']
     user = User.query.filter_by(username=username).first()
     if user and user.check_password(data['password']):
+        if needs_rehash(user.password_hash) and not password_too_long(data['password']):
+            # Hash parameters changed since this password was stored: upgrade it while we have the plaintext
+            # (an older PBKDF2 password over bcrypt's 72 bytes keeps its hash rather than being truncated)
+            try:
+                user.set_password(data['password'])
+                db.session.commit()
+                logger.info(f"Rehashed password for {username}")
+            except PasswordHasherBusy:
+                logger.info(f"Skipped rehash for {username}: hashing pool busy")  # Retried on a later login
         token = jwt.encode({
             'user_id': user.id,
             'username': user.username,
@@ -121,47 +158,62 @@ def login():
     logger.warning(f"Login failed: Invalid credentials for {username}")
     return jsonify({'error': 'Invalid username or password'}), 401
 
+def like_prefix(q):
+    # LIKE 'q%' (ESCAPE '/') with the user's %, _ and / taken literally, so it stays an index range scan
+    return q.replace('/', '//').replace('%', '/%').replace('_', '/_') + '%'
+
 @app.route('/users', methods=['GET'])
+@auth.require_admin
 def get_all_users():
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    if user_data.get('role') != 'admin':
-        error_msg = 'Admin role required'
-        logger.warning(f"Non-admin attempt to get users by user_id={user_data.get('user_id')} - Returning 403")
-        return jsonify({'error': error_msg}), 403
+    user_data = g.user
+    limit = request.args.get('limit', USERS_PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 422
+    limit = min(limit, MAX_USERS_PAGE_SIZE)
+    after = request.args.get('after', '')  # Keyset cursor: last username of the previous page
+    q = request.args.get('q', '').strip()
+    role = request.args.get('role')
+    if role and role not in ['user', 'admin']:
+        return jsonify({'error': 'role must be user or admin'}), 422
     
-    users = User.query.all()
+    # Ordered by username so paging, the prefix search and the cursor all walk the UNIQUE username index
+    query = User.query.options(load_only(User.id, User.username, User.role))
+    if q:
+        query = query.filter(User.username.like(like_prefix(q), escape='/'))
+    if role:
+        query = query.filter(User.role == role)
+    if after:
+        query = query.filter(User.username > after)
+    users = query.order_by(User.username).limit(limit + 1).all()
+    next_cursor = users[limit - 1].username if len(users) > limit else None
     users_data = [
         {
             'id': u.id,
             'username': u.username,
             'role': u.role
         }
-        for u in users
+        for u in users[:limit]
     ]
-    logger.info(f"Returning {len(users_data)} users for admin user_id={user_data.get('user_id')}")
-    return jsonify({'users': users_data})
+    logger.info(f"Returning {len(users_data)} users (q={q!r}, role={role}, after={after!r}) for admin user_id={user_data.get('user_id')}")
+    return jsonify({'users': users_data, 'next_cursor': next_cursor})
+
+@app.route('/users/export', methods=['GET'])  # Admin-only: all users as streamed NDJSON/CSV
+@auth.require_admin
+def export_users():
+    user_data = g.user
+    try:
+        fmt = export_format()
+    except ValueError as e:
+        logger.warning(f"{str(e)} - Returning 422")
+        return jsonify({'error': str(e)}), 422
+    
+    logger.info(f"Streaming {fmt} user export for admin user_id={user_data.get('user_id')}")
+    query = User.query.options(load_only(User.id, User.username, User.role)).order_by(User.id)  # Never password hashes
+    return export_response(query, lambda u: {'id': u.id, 'username': u.username, 'role': u.role}, ['id', 'username', 'role'], fmt, 'users')
 
 @app.route('/users', methods=['POST'])
+@auth.require_admin
 def create_user():
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        return jsonify({'error': 'Missing or invalid Authorization header'}), 422
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        return jsonify({'error': 'Invalid or expired token'}), 422
-    if user_data.get('role') != 'admin':
-        return jsonify({'error': 'Admin role required'}), 403
     data = request.get_json()
     if not data or not all(k in data for k in ['username', 'password', 'role']):
         return jsonify({'error': 'Missing username, password, or role'}), 422
@@ -170,8 +222,10 @@ def create_user():
         return jsonify({'error': 'Username already exists'}), 409
     if data['role'] not in ['user', 'admin']:
         return jsonify({'error': 'Role must be user or admin'}), 422
-    if len(data['password']) < 6:
-        return jsonify({'error': 'Password must be at least 6 characters'}), 422
+    if len(data['password']) < MIN_PASSWORD_LENGTH:
+        return jsonify({'error': f'Password must be at least {MIN_PASSWORD_LENGTH} characters'}), 422
+    if password_too_long(data['password']):
+        return jsonify({'error': f'Password must be at most {MAX_PASSWORD_BYTES} bytes'}), 422
     user = User(username=username, role=data['role'])
     user.set_password(data['password'])
     db.session.add(user)
@@ -179,25 +233,153 @@ def create_user():
     logger.info(f"Admin created user: {username} with role {data['role']}")
     return jsonify({'message': 'User  created successfully', 'user_id': user.id}), 201
 
+def username_key(username):
+    # Approximates utf8mb4_unicode_ci, the collation of the users.username unique key: case and
+    # accents are ignored and so are trailing spaces ('José ' and 'jose' are the same username)
+    decomposed = unicodedata.normalize('NFKD', username)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().rstrip(' ')
+
+def validate_user_row(row):
+    # Returns (username, password, role) or an error message
+    username = str(row.get('username') or '').strip()
+    password = str(row.get('password') or '')
+    role = str(row.get('role') or 'user')
+    if not username or not password:
+        return 'Missing username or password'
+    if len(username) > USERNAME_MAX_LENGTH:
+        return f'Username longer than {USERNAME_MAX_LENGTH} characters'
+    if len(password) < MIN_PASSWORD_LENGTH:
+        return f'Password must be at least {MIN_PASSWORD_LENGTH} characters'
+    if password_too_long(password):
+        return f'Password must be at most {MAX_PASSWORD_BYTES} bytes'
+    if role not in ['user', 'admin']:
+        return 'Role must be user or admin'
+    return username, password, role
+
+@app.route('/users/bulk', methods=['POST'])  # Admin-only: streamed NDJSON (default) or CSV of username,password[,role]
+@auth.require_admin
+def bulk_create_users():
+    user_data = g.user
+    batch_size = request.args.get('batch_size', BULK_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 422
+    batch_size = min(batch_size, MAX_BULK_BATCH_SIZE)
+    
+    created = 0
+    results = []  # One entry per input row, in input order
+    seen = set()  # username_key() of the rows already accepted from this upload
+    batch = []  # (result entry, password, role)
+    
+    def insert_rows_one_by_one(items, rows):
+        # The batch INSERT hit the unique key (a collation match username_key() missed, or a user
+        # created concurrently): store what can be stored instead of failing the whole batch
+        nonlocal created
+        for (entry, _, _), values in zip(items, rows):
+            try:
+                db.session.execute(insert(User), values)
+                db.session.commit()
+                created += 1
+                entry['status'] = 'created'
+            except IntegrityError:
+                db.session.rollback()
+                entry.update(status='exists', error='Username already exists')
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Bulk user row failed: {str(e)}")
+                entry.update(status='failed', error='Insert failed')
+    
+    def flush():
+        # One IN query for collisions, one parallel hashing pass, one executemany INSERT and one commit per batch
+        nonlocal created
+        if not batch:
+            return
+        names = [entry['username'] for entry, _, _ in batch]
+        taken = {username_key(name) for (name,) in db.session.query(User.username).filter(User.username.in_(names))}
+        fresh = [item for item in batch if username_key(item[0]['username']) not in taken]
+        for entry, _, _ in batch:
+            if username_key(entry['username']) in taken:
+                entry.update(status='exists', error='Username already exists')
+        batch.clear()
+        if not fresh:
+            return  # Every row already exists; an empty executemany would still send an INSERT
+        try:
+            hashes = hash_passwords([password for _, password, _ in fresh])
+        except PasswordHasherBusy as e:
+            logger.error(f"Bulk user batch failed: {str(e)}")
+            for entry, _, _ in fresh:
+                entry.update(status='failed', error='Batch insert failed')
+            return
+        rows = [
+            {'username': entry['username'], 'password_hash': password_hash, 'role': role}
+            for (entry, _, role), password_hash in zip(fresh, hashes)
+        ]
+        try:
+            db.session.execute(insert(User), rows)
+            db.session.commit()
+            created += len(fresh)
+            for entry, _, _ in fresh:
+                entry['status'] = 'created'
+        except IntegrityError as e:
+            db.session.rollback()
+            logger.warning(f"Bulk user batch hit an existing username, retrying row by row: {str(e.orig)}")  # e.orig: the message without the bound hashes
+            insert_rows_one_by_one(fresh, rows)
+        except SQLAlchemyError as e:
+            # Nothing in this batch was stored
+            db.session.rollback()
+            logger.error(f"Bulk user batch failed: {str(e)}")
+            for entry, _, _ in fresh:
+                entry.update(status='failed', error='Batch insert failed')
+    
+    try:
+        for line_no, row, error in iter_bulk_rows():
+            entry = {'line': line_no, 'username': row.get('username') if row else None}
+            results.append(entry)
+            checked = validate_user_row(row) if not error else error
+            if isinstance(checked, str):
+                entry.update(status='invalid', error=checked)
+                continue
+            username, password, role = checked
+            entry['username'] = username
+            if username_key(username) in seen:
+                entry.update(status='duplicate', error='Username appears earlier in this upload')
+                continue
+            seen.add(username_key(username))
+            batch.append((entry, password, role))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        logger.warning(f"Bulk user import aborted after {created} users: {str(e)}")
+        return jsonify({'error': f'Unreadable body: {str(e)}', 'created': created}), 422
+    
+    logger.info(f"Bulk user import: {created} created, {len(results) - created} rejected by admin user_id={user_data['user_id']}")
+    return jsonify({'created': created, 'failed': len(results) - created, 'results': results}), 200
+
 @app.route('/users/<int:user_id>', methods=['DELETE'])
+@auth.require_admin
 def delete_user(user_id):
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        return jsonify({'error': 'Missing or invalid Authorization header'}), 422
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        return jsonify({'error': 'Invalid or expired token'}), 422
-    if user_data.get('role') != 'admin':
-        return jsonify({'error': 'Admin role required'}), 403
+    user_data = g.user
     if user_data.get('user_id') == user_id:
         return jsonify({'error': 'Cannot delete your own account'}), 403
     user = User.query.filter_by(id=user_id).first()
     if not user:
         return jsonify({'error': 'User  not found'}), 404
     username = user.username
+    if open_loan_count(db.session, 'user_id', user_id):
+        db.session.rollback()
+        logger.warning(f"Delete user: {username} (ID {user_id}) has books on loan - Returning 409")
+        return jsonify({'error': 'User has borrowed books; delete the account once they are returned'}), 409
+    archived = archive_closed_loans(db.session, 'user_id', user_id)  # borrows keeps a RESTRICT foreign key to users
     db.session.delete(user)
-    db.session.commit()
-    logger.info(f"Admin deleted user: {username} (ID {user_id})")
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        # Borrowed something between the check and the commit
+        db.session.rollback()
+        logger.warning(f"Delete user: {username} (ID {user_id}) still referenced: {str(e.orig)} - Returning 409")
+        return jsonify({'error': 'User has borrowed books; delete the account once they are returned'}), 409
+    logger.info(f"Admin deleted user: {username} (ID {user_id}), {archived} past loans archived")
     return jsonify({'message': 'User  deleted successfully'}), 200
 
 if __name__ == '__main__':
@@ -0,0 +1,130 @@
+import os
+import logging
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Hashing settings; changing the scheme or cost rehashes each user's password on their next login
+PASSWORD_SCHEME = os.getenv('PASSWORD_SCHEME', 'bcrypt')  # bcrypt | pbkdf2
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '600000'))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))  # Hashing processes per gunicorn worker
+# In-flight jobs per gunicorn worker before 503. Each job holds a request thread, so the limit must stay
+# below the thread count (GUNICORN_THREADS, see common/gunicorn_conf.py) or it can never be reached;
+# the default leaves one thread free for requests that do not hash
+REQUEST_THREADS = int(os.getenv('GUNICORN_THREADS', '1'))
+HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', str(max(1, REQUEST_THREADS - 1))))
+MAX_PASSWORD_BYTES = 72  # bcrypt ignores everything after the 72nd byte, so longer passwords are refused
+HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+BULK_WORKERS = int(os.getenv('PASSWORD_BULK_WORKERS', str(os.cpu_count() or 2)))  # Separate pool for /users/bulk
+
+if PASSWORD_SCHEME not in ('bcrypt', 'pbkdf2'):
+    raise ValueError(f'PASSWORD_SCHEME must be bcrypt or pbkdf2, not {PASSWORD_SCHEME}')
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool is at its queue limit (or too slow); the caller should answer 503."""
+
+
+def password_too_long(password):
+    return len(password.encode()) > MAX_PASSWORD_BYTES
+
+
+def _hash(scheme, cost, password):
+    # Runs in a pool process
+    if scheme == 'bcrypt':
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=cost)).decode()
+    return generate_password_hash(password, method=f'pbkdf2:sha256:{cost}')
+
+
+def _verify(password, stored_hash):
+    # Runs in a pool process; accepts bcrypt and any Werkzeug hash, so older rows keep working
+    if stored_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode(), stored_hash.encode())
+    return check_password_hash(stored_hash, password)
+
+
+def _current_cost():
+    return BCRYPT_ROUNDS if PASSWORD_SCHEME == 'bcrypt' else PBKDF2_ITERATIONS
+
+
+def needs_rehash(stored_hash):
+    """True if the hash was made with another scheme or cost than the configured one."""
+    if stored_hash.startswith('$2'):
+        return PASSWORD_SCHEME != 'bcrypt' or int(stored_hash.split('$')[2]) != BCRYPT_ROUNDS
+    method = stored_hash.split('$', 1)[0]  # e.g. pbkdf2:sha256:600000
+    return PASSWORD_SCHEME != 'pbkdf2' or method != f'pbkdf2:sha256:{PBKDF2_ITERATIONS}'
+
+
+_pools = {}  # name -> (pid, executor); 'login' for interactive requests, 'bulk' for provisioning
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+
+def _get_pool(name='login', workers=HASH_WORKERS):
+    with _pool_lock:
+        pid = os.getpid()
+        entry = _pools.get(name)
+        if entry is None or entry[0] != pid:
+            # forkserver: children start from a clean process, not a fork of a threaded gunicorn worker
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+            entry = _pools[name] = (pid, executor)
+            logger.info(f"Password hashing pool '{name}' started ({workers} processes, {PASSWORD_SCHEME}, cost {_current_cost()})")
+        return entry[1]
+
+
+def _discard_pool(name):
+    # A pool process died (e.g. OOM-killed); every later submit would fail, so start a new pool next time
+    logger.error(f"Password hashing pool '{name}' died; starting a new one on the next request")
+    with _pool_lock:
+        _pools.pop(name, None)
+
+
+def _run(fn, *args):
+    # Bounded hand-off: refuse new work instead of letting requests pile up behind the pool
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy(f'{HASH_QUEUE_LIMIT} password operations already in progress')
+    try:
+        future = _get_pool().submit(fn, *args)
+        future.add_done_callback(lambda _: _slots.release())  # Slot is held until the job really finishes
+    except BaseException:
+        _slots.release()
+        raise
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()  # Still queued: nobody is waiting for it any more
+        raise PasswordHasherBusy(f'Password operation took longer than {HASH_TIMEOUT}s')
+    except BrokenProcessPool:
+        _discard_pool('login')
+        raise PasswordHasherBusy('Password hashing pool restarted')
+
+
+def hash_password(password):
+    return _run(_hash, PASSWORD_SCHEME, _current_cost(), password)
+
+
+def verify_password(password, stored_hash):
+    return _run(_verify, password, stored_hash)
+
+
+def hash_passwords(passwords):
+    """Hash many passwords in parallel on the bulk pool (all cores by default); keeps input order.
+
+    Runs apart from the login pool, so provisioning a cohort does not queue ahead of sign-ins.
+    """
+    if not passwords:
+        return []
+    hash_one = functools.partial(_hash, PASSWORD_SCHEME, _current_cost())
+    chunksize = max(1, len(passwords) // (BULK_WORKERS * 4))  # Few round trips, but still spread over every process
+    try:
+        return list(_get_pool('bulk', BULK_WORKERS).map(hash_one, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        _discard_pool('bulk')
+        raise PasswordHasherBusy('Password hashing pool restarted')
@@ -0,0 +1,85 @@
+"""Per-request token check cost: jwt.decode against the cached verifier in common/auth.py.
+
+Times, per call on this machine:
+  - jwt.decode            what every service did on every request before common/auth.py
+  - verify, cache miss    a token the worker has not seen (digest + decode + insert)
+  - verify, cache hit     the same token again (digest + dict lookup, no HMAC)
+  - require_user, hit     the decorator around a view: header parse, span, verify hit, g.user
+
+    python benchmarks/auth_overhead.py --calls 20000
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+import jwt
+from flask import Flask, g
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from common.auth import TokenAuth, TokenVerifier  # noqa: E402
+
+SECRET = 'benchmark-secret'
+
+
+def mint():
+    return jwt.encode({'user_id': 1, 'username': 'benchmark', 'role': 'user',
+                       'exp': datetime.utcnow() + timedelta(hours=1)}, SECRET, algorithm='HS256')
+
+
+def per_call(fn, calls):
+    # Microseconds per call, best of 3 runs to keep scheduler noise out
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for i in range(calls):
+            fn(i)
+        elapsed = (time.perf_counter() - started) / calls * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000, help='Calls per measurement')
+    args = parser.parse_args()
+
+    token = mint()
+
+    def decode(i):
+        jwt.decode(token, SECRET, algorithms=['HS256'])
+
+    cold = TokenVerifier(SECRET, max_entries=0)  # Evicts every entry right after inserting it
+
+    def verify_miss(i):
+        cold.verify(token)
+
+    warm = TokenVerifier(SECRET)
+    warm.verify(token)
+
+    def verify_hit(i):
+        warm.verify(token)
+
+    app = Flask(__name__)
+    auth = TokenAuth(SECRET)
+    view = auth.require_user(lambda: g.user)
+
+    def require_user_hit(i):
+        view()
+
+    with app.test_request_context('/', headers={'Authorization': f'Bearer {token}'}):  # One context, reused per call
+        rows = [
+            ('jwt.decode', per_call(decode, args.calls)),
+            ('verify, cache miss', per_call(verify_miss, args.calls)),
+            ('verify, cache hit', per_call(verify_hit, args.calls)),
+            ('require_user, hit', per_call(require_user_hit, args.calls)),
+        ]
+    print(f"PyJWT {jwt.__version__}, {args.calls} calls, best of 3")
+    print(f"{'check':<20} {'us/call':>8}")
+    for name, micros in rows:
+        print(f"{name:<20} {micros:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
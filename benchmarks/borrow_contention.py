@@ -0,0 +1,132 @@
+"""Borrow/return throughput and the single-book race, against a running borrow-service.
+
+    # Many clients, each borrowing and returning its own book in a loop (throughput, p50/p99)
+    python benchmarks/borrow_contention.py spread --user-id 2 --book-ids 1-16 --seconds 10
+    # Many clients borrowing the same book at once (exactly one 201 expected)
+    python benchmarks/borrow_contention.py race --user-id 2 --book-ids 5 --clients 32
+
+Tokens are minted with JWT_SECRET, so run it with the stack's .env loaded. The user must exist
+and the books must be available; `spread` returns every loan it makes.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import datetime, timedelta
+import jwt
+
+
+def parse_ids(spec):
+    # '1-16' or '3,5,8'
+    ids = []
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        ids.extend(range(int(first), int(last or first) + 1))
+    return ids
+
+
+class Client:
+    def __init__(self, base_url, user_id, secret):
+        self.base_url = base_url.rstrip('/')
+        self.user_id = user_id
+        token = jwt.encode({'user_id': user_id, 'username': 'benchmark', 'role': 'user',
+                            'exp': datetime.utcnow() + timedelta(hours=1)}, secret, algorithm='HS256')
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+
+    def post(self, path, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        req = urllib.request.Request(f'{self.base_url}{path}', data=data, headers=self.headers, method='POST')
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                status, payload = response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, {}
+        return status, payload, time.perf_counter() - started
+
+    def borrow(self, book_id):
+        return self.post('/borrow', {'user_id': self.user_id, 'book_id': book_id})
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_spread(client, book_ids, seconds):
+    statuses = Counter()
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def loop(book_id):
+        while time.monotonic() < deadline:
+            status, payload, elapsed = client.borrow(book_id)
+            results = [(status, elapsed)]
+            if status == 201:
+                status, _, elapsed = client.post(f"/return/{payload['borrow_id']}")
+                results.append((status, elapsed))
+            with lock:
+                for result_status, result_elapsed in results:
+                    statuses[result_status] += 1
+                    latencies.append(result_elapsed)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=loop, args=(book_id,)) for book_id in book_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    print(f"{len(book_ids)} clients, {elapsed:.1f}s: {sum(statuses.values()) / elapsed:.1f} borrow+return requests/s, "
+          f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"statuses: {dict(statuses)}")
+
+
+def run_race(client, book_id, clients):
+    start = threading.Barrier(clients)
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def borrow():
+        start.wait()
+        status = client.borrow(book_id)[0]
+        with lock:
+            statuses[status] += 1
+
+    threads = [threading.Thread(target=borrow) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f"{clients} concurrent borrows of book {book_id}: {dict(statuses)}")
+    if statuses[201] != 1:
+        raise SystemExit(f'expected exactly one 201, got {statuses[201]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=['spread', 'race'])
+    parser.add_argument('--url', default=os.getenv('BORROW_SERVICE_URL', 'http://localhost:5003'))
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--book-ids', required=True, help="One client per book for spread, e.g. 1-16; race uses the first")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent requests in race mode')
+    args = parser.parse_args()
+
+    client = Client(args.url, args.user_id, os.environ['JWT_SECRET'])
+    book_ids = parse_ids(args.book_ids)
+    if args.mode == 'spread':
+        run_spread(client, book_ids, args.seconds)
+    else:
+        run_race(client, book_ids[0], args.clients)
+
+
+if __name__ == '__main__':
+    main()
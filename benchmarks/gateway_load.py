@@ -0,0 +1,213 @@
+"""Gateway page throughput with sync against gevent workers, behind a stub upstream.
+
+Starts one stub that answers every auth, book and borrow call after `--delay` ms, then, for each
+worker class, runs the gateway the way its image does (gunicorn -c common/gunicorn_conf.py,
+3 workers) and loads each page with `--concurrency` keep-alive clients for `--seconds`.
+
+gunicorn and gevent come from the interpreter that runs the script. To measure what ships,
+use a virtualenv with the pinned requirements.txt:
+
+    python -m venv /tmp/gateway-bench && /tmp/gateway-bench/bin/pip install -r requirements.txt
+    /tmp/gateway-bench/bin/python benchmarks/gateway_load.py --concurrency 50 200 --delay 200 --seconds 10
+
+The stub, the gateway and the clients share the machine, so on few cores the figures include
+their competition for CPU.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timedelta
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = 'benchmark-secret'
+
+BOOK = {'id': 1, 'title': 'The Linux Command Line', 'author': 'William Shotts', 'bio_excerpt': 'Writer and teacher.',
+        'author_bio': 'Writer and teacher.', 'image_url': None, 'book_url': 'https://example.org/tlcl.pdf', 'available': True}
+
+
+def stub_payload(path):
+    path = path.split('?')[0]
+    if path == '/login':
+        token = jwt.encode({'user_id': 1, 'username': 'admin', 'role': 'admin',
+                            'exp': datetime.utcnow() + timedelta(hours=1)}, JWT_SECRET, algorithm='HS256')
+        return {'token': token}
+    if path == '/books/all':
+        return {'books': [dict(BOOK, id=i) for i in range(1, 21)], 'next_cursor': None}
+    if path.startswith('/books/'):
+        return {'book': BOOK}
+    if path == '/users':
+        return {'users': [{'id': i, 'username': f'user{i}', 'role': 'user'} for i in range(1, 21)], 'next_cursor': None}
+    if path == '/borrows/all':
+        return {'borrows': [{'borrow_id': i, 'user_id': i, 'username': f'user{i}', 'title': BOOK['title'],
+                             'borrow_date': '2024-01-01T10:00:00'} for i in range(1, 21)], 'next_cursor': None}
+    return {}
+
+
+async def serve_stub_connection(reader, writer, delay):
+    # Minimal HTTP/1.1 with keep-alive: enough for the gateway's requests-based clients
+    try:
+        while True:
+            head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+            path = head[0].split(' ')[1]
+            length = 0
+            for line in head[1:]:
+                name, _, value = line.partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+            await asyncio.sleep(delay)
+            body = json.dumps(stub_payload(path)).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def run_stub(port, delay_ms):
+    async def main():
+        server = await asyncio.start_server(lambda r, w: serve_stub_connection(r, w, delay_ms / 1000),
+                                            '127.0.0.1', port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, path='/healthz', seconds=30):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'nothing answered on port {port}')
+
+
+def sign_in(port):
+    # The stub accepts any credentials; the gateway answers with its session cookie
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('POST', '/signin', body='username=admin&password=x',
+                 headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    cookie = response.getheader('Set-Cookie', '').split(';')[0]
+    if response.status != 302 or not cookie:
+        raise SystemExit(f'sign-in through the gateway failed: {response.status}')
+    return cookie
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def load(port, path, cookie, concurrency, seconds):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': cookie})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()  # Reconnects on the next request
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+        conn.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99), len(errors)
+
+
+def start_gateway(worker_class, workers, upstream_url):
+    port = free_port()
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, JWT_SECRET=JWT_SECRET, SECRET_KEY='benchmark',
+               AUTH_SERVICE_URL=upstream_url, BOOK_SERVICE_URL=upstream_url, BORROW_SERVICE_URL=upstream_url)
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'common/gunicorn_conf.py', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), 'app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for(port)
+    return process, port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gevent'])
+    parser.add_argument('--workers', type=int, default=3, help='gunicorn workers (the gateway image runs 3)')
+    parser.add_argument('--paths', nargs='+', default=['/book/1', '/admin'], help='/admin fans out to all three services')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--delay', type=float, default=200, help='Stub upstream latency in ms')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--stub', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub:
+        run_stub(args.stub, args.delay)
+        return
+
+    import gevent
+    import gunicorn
+    print(f"Python {platform.python_version()}, gunicorn {gunicorn.__version__}, gevent {gevent.__version__}, "
+          f"{os.cpu_count()} cores; {args.workers} workers, upstream {args.delay:g} ms, {args.seconds:g}s per run")
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, __file__, '--stub', str(stub_port), '--delay', str(args.delay)])
+    try:
+        wait_for(stub_port, path='/')
+        print(f"{'workers':<8} {'path':<10} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for worker_class in args.worker_classes:
+            gateway, port = start_gateway(worker_class, args.workers, f'http://127.0.0.1:{stub_port}')
+            try:
+                cookie = sign_in(port)
+                for path in args.paths:
+                    for concurrency in args.concurrency:
+                        rate, p50, p99, errors = load(port, path, cookie, concurrency, args.seconds)
+                        print(f"{worker_class:<8} {path:<10} {concurrency:>7} {rate:>8.1f} {p50 * 1000:>8.0f} "
+                              f"{p99 * 1000:>8.0f} {errors:>7}")
+            finally:
+                gateway.terminate()
+                gateway.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Password checks per second against the number of hashing processes (auth/passwords.py).
+
+Each run starts a fresh interpreter with PASSWORD_HASH_WORKERS set, then keeps `--concurrency`
+threads calling verify_password() for `--seconds`, the same path /login takes:
+
+    python benchmarks/login_throughput.py --workers 1 2 4 --concurrency 8 --seconds 5
+
+Multiply by the gunicorn workers of auth-service for the service-wide figure.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(concurrency, seconds):
+    # Runs in the child interpreter, with the pool settings already in its environment
+    sys.path.insert(0, os.path.join(ROOT, 'auth'))
+    import passwords
+
+    stored_hash = passwords.hash_password('benchmark-password')
+    counts = {'ok': 0, 'busy': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            try:
+                passwords.verify_password('benchmark-password', stored_hash)
+                outcome = 'ok'
+            except passwords.PasswordHasherBusy:
+                outcome = 'busy'
+                time.sleep(0.01)
+            with lock:
+                counts[outcome] += 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    print(json.dumps({'logins_per_second': round(counts['ok'] / elapsed, 1), 'busy': counts['busy']}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='PASSWORD_HASH_WORKERS values to try')
+    parser.add_argument('--concurrency', type=int, default=8, help='Threads calling verify_password at once')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--queue-limit', type=int, help='PASSWORD_HASH_QUEUE_LIMIT (default: --concurrency, so nothing is shed)')
+    parser.add_argument('--rounds', default=os.getenv('BCRYPT_ROUNDS', '12'), help='BCRYPT_ROUNDS')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.concurrency, args.seconds)
+        return
+
+    print(f"bcrypt cost {args.rounds}, {args.concurrency} concurrent logins, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'logins/s':>10} {'503s':>6}")
+    for workers in args.workers:
+        env = dict(os.environ,
+                   PASSWORD_SCHEME='bcrypt',
+                   BCRYPT_ROUNDS=str(args.rounds),
+                   PASSWORD_HASH_WORKERS=str(workers),
+                   PASSWORD_HASH_QUEUE_LIMIT=str(args.queue_limit or args.concurrency))
+        out = subprocess.run(
+            [sys.executable, __file__, '--child', '--concurrency', str(args.concurrency), '--seconds', str(args.seconds)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{workers:>8} {result['logins_per_second']:>10} {result['busy']:>6}")
+
+
+if __name__ == '__main__':
+    main()
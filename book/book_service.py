@@ -1,21 +1,61 @@
 import os
+import re
+import csv
+import hashlib
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
-import jwt
+from sqlalchemy import desc, insert
+from sqlalchemy.dialects.mysql import match  # MariaDB FULLTEXT MATCH ... AGAINST
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import load_only
 from dotenv import load_dotenv
+from catalog_cache import CatalogCache
+from common.auth import TokenAuth
+from common.db import database_uri, engine_options, init_db_pool
+from common.bulk import iter_bulk_rows
+from common.loans import archive_closed_loans, open_loan_count
+from common.export import export_format, export_response
+from common.logs import setup_logging, init_request_logging
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.health import init_health
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}?charset=utf8mb4'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()  # DB_HOST, DB_USER, ... or DATABASE_URL: common/db.py
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('BOOK')  # Pool size, pre-ping, recycle: common/db.py
 db = SQLAlchemy(app)
 
-logging.basicConfig(level=logging.DEBUG)
+setup_logging('book-service')
+init_request_logging(app)
+init_metrics(app, 'book-service', db)
+init_tracing(app)
+init_health(app, db)
 logger = logging.getLogger(__name__)
 
 JWT_SECRET = os.getenv('JWT_SECRET')
+auth = TokenAuth(JWT_SECRET, unauthorized_status=422, admin_error='Admin role required')  # Verified-token cache per worker
+init_db_pool(app, db, auth.require_admin)  # 503 when no connection is free within the pool timeout; GET /debug/pool
+DEFAULT_PAGE_SIZE = int(os.getenv('BOOKS_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('BOOKS_MAX_PAGE_SIZE', '200'))
+MAX_SEARCH_TERMS = 8
+BIO_EXCERPT_LENGTH = 100
+BOOK_FIELDS = ('id', 'title', 'author', 'author_bio', 'image_url', 'book_url', 'available')  # Default projection
+SELECTABLE_FIELDS = BOOK_FIELDS + ('bio_excerpt',)  # Accepted by ?fields=
+BULK_BATCH_SIZE = int(os.getenv('BOOKS_BULK_BATCH_SIZE', '1000'))
+MAX_BULK_BATCH_SIZE = 10000
+MAX_BULK_ERRORS = 1000  # Row errors listed in a bulk report; the count is always exact
+BOOK_COLUMN_LIMITS = {'title': 200, 'author': 100, 'image_url': 500, 'book_url': 500}  # VARCHAR sizes in database.sql
+SEARCH_TERM_RE = re.compile(r'\w+', re.UNICODE)  # Drops boolean-mode operators (+ - * " ~ < > ( ) @) from user input
+
+# Per-worker cache of serialised catalog reads, invalidated through the catalog_version row
+catalog_cache = CatalogCache(
+    max_entries=int(os.getenv('CATALOG_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', '300'))
+)
 
 class Book(db.Model):
     __tablename__ = 'books'  # Explicitly map to plural table name (fixes 1146 error)
@@ -26,117 +66,212 @@ class Book(db.Model):
     image_url = db.Column(db.String(500))  # URL to book cover image
     book_url = db.Column(db.String(500), nullable=False)  # URL to full book content (PDF/online)
     available = db.Column(db.Boolean, default=True)  # True if available for borrow
+    # Computed in SQL so listings can show a teaser without transferring the whole TEXT column
+    bio_excerpt = db.column_property(db.func.substr(author_bio, 1, BIO_EXCERPT_LENGTH), deferred=True)
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'  # Single row (id=1), bumped by every write to books
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
 
-def get_user_from_token(token):
+def current_catalog_version():
+    # One primary-key lookup per request; None disables caching (e.g. table not created yet)
     try:
-        decoded = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        logger.debug(f"Token decoded: user_id={decoded.get('user_id')}, role={decoded.get('role')}")
-        return decoded
-    except jwt.InvalidTokenError as e:
-        logger.warning(f"Invalid token: {str(e)}")
+        return db.session.query(CatalogVersion.version).filter_by(id=1).scalar()
+    except PoolTimeoutError:
+        raise  # Pool exhausted: answer 503 now rather than wait the pool timeout a second time
+    except SQLAlchemyError as e:
+        logger.warning(f"Catalog version unavailable, bypassing cache: {str(e)}")
+        db.session.rollback()
         return None
-    except jwt.ExpiredSignatureError:
-        logger.warning("Token expired")
+
+def bump_catalog_version():
+    # Call inside the writing transaction so the bump commits atomically with the change
+    CatalogVersion.query.filter_by(id=1).update({CatalogVersion.version: CatalogVersion.version + 1})
+
+def catalog_etag(version):
+    # Strong validator: same catalog version + same URL (path and query) => byte-identical body
+    if version is None:
         return None
+    return hashlib.sha1(f'{version}:{request.full_path}'.encode()).hexdigest()
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def cached_read(version, key, load):
+    if version is not None:
+        value = catalog_cache.get(version, key)
+        if value is not None:
+            return value
+    value = load()
+    if version is not None and value is not None:
+        catalog_cache.set(version, key, value)
+    return value
+
+def serialize_book(b, fields=BOOK_FIELDS):
+    # Only touch requested attributes; reading a deferred one would trigger a lazy load
+    return {f: getattr(b, f) for f in fields}
+
+def parse_fields():
+    # Sparse fieldsets: ?fields=id,title,bio_excerpt (id is always included)
+    raw = request.args.get('fields')
+    if not raw:
+        return BOOK_FIELDS
+    requested = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = requested - set(SELECTABLE_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))} (allowed: {", ".join(SELECTABLE_FIELDS)})')
+    requested.add('id')
+    return tuple(f for f in SELECTABLE_FIELDS if f in requested)
+
+def project(fields):
+    # Load only the selected columns; everything else stays deferred and is never read from MariaDB
+    return load_only(*[getattr(Book, f) for f in fields])
 
-@app.before_request
-def log_request():
-    logger.debug(f"Book request: {request.method} {request.url}")
-    logger.debug(f"Headers: {dict(request.headers)}")
-    logger.debug(f"Params: {request.args}")
-    logger.debug(f"Body: {request.get_json(silent=True) or {}}")
+def parse_page_args():
+    # Keyset paging: ?limit=N&after=<last id of previous page>
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    after = request.args.get('after', 0, type=int)
+    if limit < 1 or after < 0:
+        raise ValueError('limit must be a positive integer and after a non-negative book id')
+    return min(limit, MAX_PAGE_SIZE), after
+
+def keyset_page(query, limit, after):
+    # Seek past the cursor on the primary key and fetch one extra row to know if another page exists
+    rows = query.filter(Book.id > after).order_by(Book.id).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def validate_book_row(row):
+    # Returns (insert values, None) or (None, error message)
+    missing = [k for k in ('title', 'author', 'book_url') if not row.get(k)]
+    if missing:
+        return None, f'Missing required fields: {", ".join(missing)}'
+    values = {
+        'title': str(row['title']),
+        'author': str(row['author']),
+        'author_bio': str(row.get('author_bio') or ''),
+        'image_url': str(row.get('image_url') or ''),
+        'book_url': str(row['book_url']),
+        'available': True
+    }
+    too_long = [k for k, size in BOOK_COLUMN_LIMITS.items() if len(values[k]) > size]
+    if too_long:
+        return None, f'Fields too long: {", ".join(too_long)}'
+    return values, None
+
+def build_search_query(q):
+    # Every term must match, each as a prefix: "lin comm" -> "+lin* +comm*"
+    terms = SEARCH_TERM_RE.findall(q or '')[:MAX_SEARCH_TERMS]
+    return ' '.join(f'+{t}*' for t in terms)
 
 @app.route('/books', methods=['GET'])
+@auth.require_user
 def get_books():
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
+    user_data = g.user
     user_id = user_data.get('user_id')
+    try:
+        limit, after = parse_page_args()
+        fields = parse_fields()
+    except ValueError as e:
+        logger.warning(f"{str(e)} - Returning 422")
+        return jsonify({'error': str(e)}), 422
     # Filter available books (add user-specific filter if needed later)
-    query = Book.query.filter_by(available=True)
+    query = Book.query.options(project(fields)).filter_by(available=True)
     if request.args.get('user_id'):
         # Placeholder for user-specific books
         pass
     
-    books = query.all()
-    books_data = [
-        {
-            'id': b.id,
-            'title': b.title,
-            'author': b.author,
-            'author_bio': b.author_bio,
-            'image_url': b.image_url,
-            'book_url': b.book_url,
-            'available': b.available
-        }
-        for b in books
-    ]
-    logger.info(f"Returning {len(books_data)} available books for user_id={user_id}")
-    return jsonify({'books': books_data})  # Consistent format: {'books': [...]}
+    version = current_catalog_version()
+    etag = catalog_etag(version)
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    def load():
+        books, next_cursor = keyset_page(query, limit, after)
+        return {'books': [serialize_book(b, fields) for b in books], 'next_cursor': next_cursor}
+    page = cached_read(version, ('books', limit, after, fields), load)
+    logger.info(f"Returning {len(page['books'])} available books after id {after} for user_id={user_id}")
+    response = jsonify(page)  # Consistent format: {'books': [...]}
+    if etag:
+        response.set_etag(etag)
+    return response
 
 @app.route('/books/all', methods=['GET'])  # New: Admin-only, all books (no available filter)
+@auth.require_admin
 def get_all_books():
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
+    user_data = g.user
+    try:
+        limit, after = parse_page_args()
+        fields = parse_fields()
+    except ValueError as e:
+        logger.warning(f"{str(e)} - Returning 422")
+        return jsonify({'error': str(e)}), 422
+    version = current_catalog_version()
+    etag = catalog_etag(version)
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    def load():
+        books, next_cursor = keyset_page(Book.query.options(project(fields)), limit, after)  # All books, no filter
+        return {'books': [serialize_book(b, fields) for b in books], 'next_cursor': next_cursor}
+    page = cached_read(version, ('books/all', limit, after, fields), load)
+    logger.info(f"Returning {len(page['books'])} books after id {after} for admin user_id={user_data.get('user_id')}")
+    response = jsonify(page)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+@app.route('/books/search', methods=['GET'])
+@auth.require_user
+def search_books():
+    user_data = g.user
+    boolean_query = build_search_query(request.args.get('q'))
+    if not boolean_query:
+        error_msg = 'Search query q is required'
         logger.warning(f"{error_msg} - Returning 422")
         return jsonify({'error': error_msg}), 422
-    
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if limit < 1 or offset < 0:
+        error_msg = 'limit must be a positive integer and offset non-negative'
         logger.warning(f"{error_msg} - Returning 422")
         return jsonify({'error': error_msg}), 422
+    limit = min(limit, MAX_PAGE_SIZE)
+    try:
+        fields = parse_fields()
+    except ValueError as e:
+        logger.warning(f"{str(e)} - Returning 422")
+        return jsonify({'error': str(e)}), 422
     
-    if user_data.get('role') != 'admin':
-        error_msg = 'Admin role required'
-        logger.warning(f"Non-admin attempt to get all books by user_id={user_data.get('user_id')} - Returning 403")
-        return jsonify({'error': error_msg}), 403
+    version = current_catalog_version()
+    etag = catalog_etag(version)
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
     
-    books = Book.query.all()  # All books, no filter
-    books_data = [
-        {
-            'id': b.id,
-            'title': b.title,
-            'author': b.author,
-            'author_bio': b.author_bio,
-            'image_url': b.image_url,
-            'book_url': b.book_url,
-            'available': b.available
-        }
-        for b in books
-    ]
-    logger.info(f"Returning {len(books_data)} all books for admin user_id={user_data.get('user_id')}")
-    return jsonify({'books': books_data})
+    def load():
+        # Served by the ft_books_search FULLTEXT index; ranked by relevance, id breaks ties so pages are stable
+        relevance = match(Book.title, Book.author, Book.author_bio, against=boolean_query).in_boolean_mode()
+        rows = db.session.query(Book, relevance.label('score')).\
+            options(project(fields)).\
+            filter(relevance).filter_by(available=True).\
+            order_by(desc('score'), Book.id).\
+            offset(offset).limit(limit + 1).all()
+        next_offset = offset + limit if len(rows) > limit else None
+        return {'books': [dict(serialize_book(b, fields), score=float(score)) for b, score in rows[:limit]], 'next_offset': next_offset}
+    page = cached_read(version, ('books/search', boolean_query, limit, offset, fields), load)
+    logger.info(f"Search '{boolean_query}' returned {len(page['books'])} books at offset {offset} for user_id={user_data.get('user_id')}")
+    response = jsonify(page)
+    if etag:
+        response.set_etag(etag)
+    return response
 
 @app.route('/books', methods=['POST'])
+@auth.require_admin
 def add_book():
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    if user_data.get('role') != 'admin':
-        error_msg = 'Admin role required'
-        logger.warning(f"Non-admin attempt to add book by user_id={user_data.get('user_id')} - Returning 403")
-        return jsonify({'error': error_msg}), 403
-    
+    user_data = g.user
     data = request.get_json()
     required_fields = ['title', 'author', 'book_url']
     if not data or not all(k in data for k in required_fields):
@@ -154,6 +289,7 @@ def add_book():
         available=True
     )
     db.session.add(book)
+    bump_catalog_version()
     db.session.commit()
     logger.info(f"Book added: '{data['title']}' by {data['author']}, URL: {data['book_url']}, Bio: {data.get('author_bio', 'N/A')} for admin user_id={user_data['user_id']}")
     return jsonify({
@@ -166,51 +302,134 @@ def add_book():
         'book_url': book.book_url
     }), 201
 
-@app.route('/books/<int:book_id>', methods=['DELETE'])
-def delete_book(book_id):
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
+@app.route('/books/export', methods=['GET'])  # Admin-only: full catalog as streamed NDJSON/CSV
+@auth.require_admin
+def export_books():
+    user_data = g.user
+    try:
+        fmt = export_format()
+    except ValueError as e:
+        logger.warning(f"{str(e)} - Returning 422")
+        return jsonify({'error': str(e)}), 422
     
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
+    logger.info(f"Streaming {fmt} book export for admin user_id={user_data['user_id']}")
+    query = Book.query.options(project(BOOK_FIELDS)).order_by(Book.id)
+    return export_response(query, serialize_book, BOOK_FIELDS, fmt, 'books')
+
+@app.route('/books/bulk', methods=['POST'])  # Admin-only: streamed NDJSON (default) or CSV import
+@auth.require_admin
+def bulk_add_books():
+    user_data = g.user
+    batch_size = request.args.get('batch_size', BULK_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        error_msg = 'batch_size must be a positive integer'
         logger.warning(f"{error_msg} - Returning 422")
         return jsonify({'error': error_msg}), 422
+    batch_size = min(batch_size, MAX_BULK_BATCH_SIZE)
+    
+    inserted = 0
+    errors = []
+    error_count = 0
+    batch, batch_lines = [], []
+    
+    def record_error(line_no, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_BULK_ERRORS:
+            errors.append({'line': line_no, 'error': message})
+    
+    def insert_rows_one_by_one():
+        # The batch INSERT was rejected by a constraint or a value: store the good rows, report the bad lines
+        nonlocal inserted
+        for line_no, values in zip(batch_lines, batch):
+            try:
+                db.session.execute(insert(Book), values)
+                bump_catalog_version()
+                db.session.commit()
+                inserted += 1
+            except (IntegrityError, DataError) as e:
+                db.session.rollback()
+                record_error(line_no, f'Rejected by the database: {str(e.orig)}')
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Bulk insert row failed: {str(e)}")
+                record_error(line_no, 'Insert failed')
     
-    if user_data.get('role') != 'admin':
-        error_msg = 'Admin role required'
-        logger.warning(f"Non-admin attempt to delete book {book_id} by user_id={user_data.get('user_id')} - Returning 403")
-        return jsonify({'error': error_msg}), 403
+    def flush():
+        # One executemany INSERT and one commit per batch; a batch the database rejects is retried row by row
+        nonlocal inserted
+        if not batch:
+            return
+        try:
+            db.session.execute(insert(Book), batch)
+            bump_catalog_version()
+            db.session.commit()
+            inserted += len(batch)
+        except (IntegrityError, DataError) as e:
+            db.session.rollback()
+            logger.warning(f"Bulk insert batch rejected, retrying row by row: {str(e.orig)}")
+            insert_rows_one_by_one()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Bulk insert batch failed: {str(e)}")
+            for line_no in batch_lines:
+                record_error(line_no, 'Batch insert failed')
+        batch.clear()
+        batch_lines.clear()
     
-    book = Book.query.get_or_404(book_id)
+    try:
+        for line_no, row, error in iter_bulk_rows():
+            values = None
+            if not error:
+                values, error = validate_book_row(row)
+            if error:
+                record_error(line_no, error)
+                continue
+            batch.append(values)
+            batch_lines.append(line_no)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        logger.warning(f"Bulk import aborted after {inserted} books: {str(e)}")
+        return jsonify({'error': f'Unreadable body: {str(e)}', 'inserted': inserted}), 422
+    
+    logger.info(f"Bulk import: {inserted} books added, {error_count} rows rejected by admin user_id={user_data['user_id']}")
+    return jsonify({
+        'inserted': inserted,
+        'failed': error_count,
+        'errors': errors,
+        'errors_truncated': error_count > len(errors)
+    }), 200
+
+@app.route('/books/<int:book_id>', methods=['DELETE'])
+@auth.require_admin
+def delete_book(book_id):
+    user_data = g.user
+    # Row lock: a concurrent borrow claims the book with an UPDATE, so it waits here and then finds no book
+    book = Book.query.filter_by(id=book_id).with_for_update().first_or_404()
     title = book.title  # For logging
+    if open_loan_count(db.session, 'book_id', book_id):
+        db.session.rollback()
+        logger.warning(f"Delete book: ID {book_id} is on loan - Returning 409")
+        return jsonify({'error': 'Book is currently borrowed; delete it once it has been returned'}), 409
+    archived = archive_closed_loans(db.session, 'book_id', book_id)  # borrows keeps a RESTRICT foreign key to books
     db.session.delete(book)
-    db.session.commit()
-    logger.info(f"Book deleted: ID {book_id} ('{title}') by admin user_id={user_data['user_id']}")
+    bump_catalog_version()
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        logger.warning(f"Delete book: ID {book_id} still referenced: {str(e.orig)} - Returning 409")
+        return jsonify({'error': 'Book is currently borrowed; delete it once it has been returned'}), 409
+    logger.info(f"Book deleted: ID {book_id} ('{title}'), {archived} past loans archived, by admin user_id={user_data['user_id']}")
     return jsonify({'message': 'Book deleted'}), 200
 
 @app.route('/books/<int:book_id>', methods=['PUT'])
+@auth.require_admin
 def update_book(book_id):
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    if user_data.get('role') != 'admin':
-        error_msg = 'Admin role required'
-        logger.warning(f"Non-admin attempt to update book {book_id} by user_id={user_data.get('user_id')} - Returning 403")
-        return jsonify({'error': error_msg}), 403
-    
+    user_data = g.user
     book = Book.query.get(book_id)
     if not book:
         logger.warning(f"Book {book_id} not found for update by user_id={user_data.get('user_id')}")
@@ -236,53 +455,49 @@ def update_book(book_id):
     if 'available' in data:
         book.available = data['available']
     
+    bump_catalog_version()
     db.session.commit()
     
     logger.info(f"Book updated: ID {book_id} ('{book.title}') by admin user_id={user_data['user_id']}")
     return jsonify({
         'message': 'Book updated',
-        'book': {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'author_bio': book.author_bio,
-            'image_url': book.image_url,
-            'book_url': book.book_url,
-            'available': book.available
-        }
+        'book': serialize_book(book)
     }), 200
 
 @app.route('/books/<int:book_id>', methods=['GET'])
+@auth.require_user
 def get_book(book_id):
-    token = request.headers.get('Authorization')
-    if not token or not token.startswith('Bearer '):
-        error_msg = 'Missing or invalid Authorization header'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
-    
-    user_data = get_user_from_token(token.replace('Bearer ', ''))
-    if not user_data:
-        error_msg = 'Invalid or expired token'
-        logger.warning(f"{error_msg} - Returning 422")
-        return jsonify({'error': error_msg}), 422
+    user_data = g.user
+    try:
+        fields = parse_fields()
+    except ValueError as e:
+        logger.warning(f"{str(e)} - Returning 422")
+        return jsonify({'error': str(e)}), 422
+    version = current_catalog_version()
+    etag = catalog_etag(version)
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
     
-    book = Book.query.get(book_id)
-    if not book:
+    def load():
+        book = Book.query.options(project(fields)).filter_by(id=book_id).first()
+        return serialize_book(book, fields) if book else None
+    book_data = cached_read(version, ('book', book_id, fields), load)
+    if not book_data:
         logger.warning(f"Book {book_id} not found for user_id={user_data.get('user_id')}")
         return jsonify({'error': 'Book not found'}), 404
     
-    book_data = {
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'author_bio': book.author_bio,
-        'image_url': book.image_url,
-        'book_url': book.book_url,
-        'available': book.available
-    }
-    
     logger.info(f"Returning book {book_id} for user_id={user_data.get('user_id')}")
-    return jsonify({'book': book_data})
+    response = jsonify({'book': book_data})
+    if etag:
+        response.set_etag(etag)
+    return response
+
+@app.route('/books/cache/stats', methods=['GET'])  # Admin-only: size the catalog cache
+@auth.require_admin
+def get_cache_stats():
+    stats = catalog_cache.stats()
+    stats['catalog_version'] = current_catalog_version()
+    return jsonify({'cache': stats})
 
 if __name__ == '__main__':
     with app.app_context():
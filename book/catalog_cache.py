@@ -0,0 +1,57 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class CatalogCache:
+    """Bounded LRU cache with a TTL, scoped to the catalog version it was filled under.
+
+    Entries are keyed by (version, key), so bumping the catalog_version row makes
+    every older entry unreachable in all workers at once; they then age out via
+    LRU eviction or the TTL.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, version, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[(version, key)]
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return entry[1]
+
+    def set(self, version, key, value):
+        with self._lock:
+            self._entries[(version, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'pid': os.getpid(),  # Each gunicorn worker has its own cache
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
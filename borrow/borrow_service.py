@@ -1,23 +1,48 @@
 import os
+import hashlib
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
-import jwt
-from datetime import datetime
+import time
+import click
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from sqlalchemy import desc  # For sorting borrows by date
+from sqlalchemy import and_, desc, insert, or_, select  # desc for sorting borrows by date
+from sqlalchemy.exc import OperationalError, SQLAlchemyError, TimeoutError as PoolTimeoutError
+from common.auth import TokenAuth
+from common.export import export_format, export_response
+from common.loans import ARCHIVE_COLUMNS
+from common.db import database_uri, engine_options, init_db_pool
+from common.logs import setup_logging, init_request_logging
+from common.metrics import init_metrics
+from common.tracing import init_tracing
+from common.health import init_health
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mysql+pymysql://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}?charset=utf8mb4'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()  # DB_HOST, DB_USER, ... or DATABASE_URL: common/db.py
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options('BORROW')  # Pool size, pre-ping, recycle: common/db.py
 db = SQLAlchemy(app)
 
-logging.basicConfig(level=logging.DEBUG)
+setup_logging('borrow-service')
+init_request_logging(app)
+init_metrics(app, 'borrow-service', db)
+init_tracing(app)
+init_health(app, db)
 logger = logging.getLogger(__name__)
 
 JWT_SECRET = os.getenv('JWT_SECRET')
+auth = TokenAuth(JWT_SECRET)  # 401 for missing/invalid tokens, 'Admin access required' for non-admins
+init_db_pool(app, db, auth.require_admin)  # 503 when no connection is free within the pool timeout; GET /debug/pool
+MAX_BATCH_ITEMS = int(os.getenv('BORROW_MAX_BATCH_ITEMS', '50'))
+LEDGER_PAGE_SIZE = int(os.getenv('BORROW_LEDGER_PAGE_SIZE', '50'))
+MAX_LEDGER_PAGE_SIZE = 200
+HISTORY_PAGE_SIZE = int(os.getenv('BORROW_HISTORY_PAGE_SIZE', '50'))
+MAX_HISTORY_PAGE_SIZE = 200
+ARCHIVE_BATCH_SIZE = int(os.getenv('BORROW_ARCHIVE_BATCH_SIZE', '1000'))  # Closed loans moved per transaction
+ARCHIVE_MIN_AGE_DAYS = int(os.getenv('BORROW_ARCHIVE_MIN_AGE_DAYS', '1'))  # Returned loans stay live this long
 
 class Borrow(db.Model):
     __tablename__ = 'borrows'
@@ -25,6 +50,16 @@ class Borrow(db.Model):
     user_id = db.Column(db.Integer, nullable=False)
     book_id = db.Column(db.Integer, nullable=False)
     borrow_date = db.Column(db.DateTime, default=datetime.utcnow)
+    return_date = db.Column(db.DateTime, nullable=True)  # NULL while the loan is open
+
+class BorrowArchive(db.Model):
+    __tablename__ = 'borrows_archive'  # Closed loans, moved out of borrows by the archive-borrows job
+    id = db.Column(db.Integer, primary_key=True)  # Same id the loan had in borrows
+    user_id = db.Column(db.Integer, nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    borrow_date = db.Column(db.DateTime, nullable=False)
+    return_date = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Book(db.Model):
     __tablename__ = 'books'
@@ -43,83 +78,243 @@ class User(db.Model):  # Placeholder—join via user_id if needed; for now, retu
     username = db.Column(db.String(80), unique=True, nullable=False)
     role = db.Column(db.String(20), default='user')
 
-def get_user_id_from_token(token):
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'  # Shared with book-service, which caches reads per version
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+def bump_catalog_version():
+    # Flipping books.available changes book-service listings, so invalidate its caches. Called after the
+    # borrow/return has committed, in its own transaction: the single catalog_version row is then locked
+    # for one UPDATE instead of for the whole claim, so borrows of different books stop queueing behind
+    # each other. A reader cannot cache pre-borrow rows under the new version (it only becomes visible
+    # after the change); if the bump fails, caches and ETags lag until the next bump or CATALOG_CACHE_TTL.
+    try:
+        CatalogVersion.query.filter_by(id=1).update({CatalogVersion.version: CatalogVersion.version + 1})
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning(f"Catalog version bump failed, cached catalog reads may be stale: {str(e)}")
+
+def current_catalog_version():
+    # Every borrow/return bumps it, so it also versions the borrow listings
+    try:
+        return db.session.query(CatalogVersion.version).filter_by(id=1).scalar()
+    except PoolTimeoutError:
+        raise  # Pool exhausted: answer 503 now rather than wait the pool timeout a second time
+    except SQLAlchemyError as e:
+        logger.warning(f"Catalog version unavailable, skipping ETag: {str(e)}")
+        db.session.rollback()
+        return None
+
+def borrows_etag(version, scope):
+    # Strong validator for a listing: data version + whose listing it is + exact URL
+    if version is None:
+        return None
+    return hashlib.sha1(f'{version}:{scope}:{request.full_path}'.encode()).hexdigest()
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def parse_id_list(data, key):
+    # De-duplicated list of positive ints from a JSON body, or ValueError
+    ids = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise ValueError(f'{key} must be a non-empty list')
+    if len(ids) > MAX_BATCH_ITEMS:
+        raise ValueError(f'At most {MAX_BATCH_ITEMS} {key} per request')
+    if not all(isinstance(i, int) and not isinstance(i, bool) and i > 0 for i in ids):
+        raise ValueError(f'{key} must contain positive integer ids')
+    return list(dict.fromkeys(ids))
+
+def parse_ledger_date(value, end_of_day=False):
+    # ISO date or datetime; a bare date used as an upper bound covers that whole day
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def parse_ledger_args():
+    # ?limit=&after=<borrow_date ISO>_<id>&user_id=&book_id=&from=&to= for /borrows/all, or ValueError
+    limit = request.args.get('limit', LEDGER_PAGE_SIZE, type=int)
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    after = request.args.get('after')
+    if after:
+        try:
+            date_part, id_part = after.rsplit('_', 1)
+            after = (datetime.fromisoformat(date_part), int(id_part))
+        except ValueError:
+            raise ValueError('after must be a cursor returned as next_cursor')
+    filters = {}
+    for key in ('user_id', 'book_id'):
+        if request.args.get(key):
+            filters[key] = request.args.get(key, type=int)
+            if filters[key] is None:
+                raise ValueError(f'{key} must be an integer')
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload['user_id'], payload['role']  # Return both for admin checks
-    except jwt.InvalidTokenError:
-        logger.warning("Invalid token in get_user_id_from_token")
-        return None, None
-
-@app.before_request
-def log_request():
-    logger.debug(f"Borrow request: {request.method} {request.url}")
-    logger.debug(f"Headers: {dict(request.headers)}")
-    logger.debug(f"Body: {request.get_json(silent=True) or {}}")
+        if request.args.get('from'):
+            filters['from'] = parse_ledger_date(request.args['from'])
+        if request.args.get('to'):
+            filters['to'] = parse_ledger_date(request.args['to'], end_of_day=True)
+    except ValueError:
+        raise ValueError('from and to must be ISO dates (YYYY-MM-DD) or datetimes')
+    return min(limit, MAX_LEDGER_PAGE_SIZE), after or None, filters
+
+def ledger_cursor(borrow):
+    return f'{borrow.borrow_date.isoformat()}_{borrow.id}'
 
 @app.route('/borrow', methods=['POST'])
+@auth.require_user
 def borrow_book():
     data = request.get_json()
     if not data or not all(k in data for k in ['user_id', 'book_id']):
         logger.warning("Borrow: Missing user_id or book_id")
         return jsonify({'error': 'Missing user_id or book_id'}), 422
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not token:
-        logger.warning("Borrow: Missing token")
-        return jsonify({'error': 'Invalid or missing token'}), 401
-    user_id, role = get_user_id_from_token(token)
-    if not user_id:
-        return jsonify({'error': 'Invalid token'}), 401
+    user_id = g.user['user_id']
     if user_id != data['user_id']:
         logger.warning(f"Borrow: Unauthorized user_id {data['user_id']} vs token {user_id}")
         return jsonify({'error': 'Unauthorized'}), 403
-    book = Book.query.filter_by(id=data['book_id'], available=True).first()
-    if not book:
-        logger.warning(f"Borrow: Book {data['book_id']} not available")
-        return jsonify({'error': 'Book not available'}), 404
-    borrow = Borrow(user_id=user_id, book_id=data['book_id'])
-    db.session.add(borrow)
-    book.available = False
-    db.session.commit()
-    logger.info(f"Book '{book.title}' (ID {book.id}) borrowed by user {user_id}")
-    return jsonify({'message': 'Book borrowed successfully', 'borrow_id': borrow.id}), 201
+    book_id = data['book_id']
+    try:
+        # Claim with one conditional UPDATE: the row lock lets exactly one concurrent request flip available 1 -> 0
+        claimed = Book.query.filter_by(id=book_id, available=True).\
+            update({Book.available: False}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            if db.session.query(Book.id).filter_by(id=book_id).first() is None:
+                logger.warning(f"Borrow: Book {book_id} not found")
+                return jsonify({'error': 'Book not found'}), 404
+            logger.info(f"Borrow: Book {book_id} already borrowed (lost race or unavailable) for user {user_id}")
+            return jsonify({'error': 'Book is already borrowed'}), 409
+        borrow = Borrow(user_id=user_id, book_id=book_id)
+        db.session.add(borrow)
+        db.session.commit()
+    except OperationalError as e:
+        # Lock wait timeout / deadlock under a burst: nothing was claimed, the client may retry
+        db.session.rollback()
+        logger.warning(f"Borrow: contention on book {book_id} for user {user_id}: {str(e)}")
+        return jsonify({'error': 'Book is busy, please retry'}), 503
+    borrow_id = borrow.id  # Read before the bump's commit expires the instance
+    bump_catalog_version()
+    logger.info(f"Book ID {book_id} borrowed by user {user_id} (borrow ID {borrow_id})")
+    return jsonify({'message': 'Book borrowed successfully', 'borrow_id': borrow_id}), 201
 
 @app.route('/return/<int:borrow_id>', methods=['POST'])
+@auth.require_user
 def return_book(borrow_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not token:
-        return jsonify({'error': 'Missing token'}), 401
-    user_id, role = get_user_id_from_token(token)
-    if not user_id:
-        return jsonify({'error': 'Invalid token'}), 401
-    borrow = Borrow.query.filter_by(id=borrow_id).first()
+    user_id = g.user['user_id']
+    borrow = db.session.query(Borrow.user_id, Borrow.book_id).filter_by(id=borrow_id, return_date=None).first()  # Only open loans can be returned
     if not borrow:
         return jsonify({'error': 'Borrow not found'}), 404
     if borrow.user_id != user_id:
         return jsonify({'error': 'Unauthorized to return this book'}), 403
-    book = Book.query.filter_by(id=borrow.book_id).first()
-    if book:
-        book.available = True
-    db.session.delete(borrow)
-    db.session.commit()
-    logger.info(f"Book '{book.title if book else 'Unknown'}' (Borrow ID {borrow_id}) returned by user {user_id}")
+    try:
+        # Close with one conditional UPDATE: of concurrent returns only one still sees return_date IS NULL,
+        # and only that one releases the book (a late duplicate cannot free a copy someone else has claimed)
+        closed = Borrow.query.filter_by(id=borrow_id, user_id=user_id, return_date=None).\
+            update({Borrow.return_date: datetime.utcnow()}, synchronize_session=False)  # Kept as history for archive-borrows
+        if not closed:
+            db.session.rollback()
+            logger.info(f"Return: Borrow ID {borrow_id} was already returned")
+            return jsonify({'error': 'Borrow not found'}), 404
+        Book.query.filter_by(id=borrow.book_id).update({Book.available: True}, synchronize_session=False)
+        title = db.session.query(Book.title).filter_by(id=borrow.book_id).scalar() or 'Unknown'
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        logger.warning(f"Return: contention on borrow {borrow_id} for user {user_id}: {str(e)}")
+        return jsonify({'error': 'Book is busy, please retry'}), 503
+    bump_catalog_version()
+    logger.info(f"Book '{title}' (Borrow ID {borrow_id}) returned by user {user_id}")
     return jsonify({'message': 'Book returned successfully'}), 200
 
+@app.route('/borrow/batch', methods=['POST'])
+@auth.require_user
+def borrow_batch():
+    data = request.get_json(silent=True)
+    user_id = g.user['user_id']
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 422
+    if data.get('user_id') != user_id:
+        logger.warning(f"Borrow batch: Unauthorized user_id {data.get('user_id')} vs token {user_id}")
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        book_ids = parse_id_list(data, 'book_ids')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 422
+    try:
+        # Lock all requested rows in one statement, then claim the available ones with one UPDATE and one INSERT
+        claimable = [row.id for row in db.session.query(Book.id).
+                     filter(Book.id.in_(book_ids), Book.available == True).
+                     with_for_update().all()]
+        if claimable:
+            Book.query.filter(Book.id.in_(claimable)).update({Book.available: False}, synchronize_session=False)
+            now = datetime.utcnow()
+            db.session.execute(insert(Borrow), [{'user_id': user_id, 'book_id': b, 'borrow_date': now} for b in claimable])
+            borrow_ids = dict(db.session.query(Borrow.book_id, Borrow.id).
+                              filter(Borrow.user_id == user_id, Borrow.book_id.in_(claimable),
+                                     Borrow.return_date.is_(None)).all())
+        existing = {row.id for row in db.session.query(Book.id).filter(Book.id.in_(book_ids)).all()}
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        logger.warning(f"Borrow batch: contention for user {user_id}: {str(e)}")
+        return jsonify({'error': 'Books are busy, please retry'}), 503
+    if claimable:
+        bump_catalog_version()
+    results = []
+    for book_id in book_ids:
+        if book_id in claimable:
+            results.append({'book_id': book_id, 'status': 'borrowed', 'borrow_id': borrow_ids.get(book_id)})
+        else:
+            results.append({'book_id': book_id, 'status': 'unavailable' if book_id in existing else 'not_found'})
+    logger.info(f"Borrow batch: user {user_id} borrowed {len(claimable)}/{len(book_ids)} books in one transaction")
+    return jsonify({'borrowed': len(claimable), 'results': results}), 200
+
+@app.route('/return/batch', methods=['POST'])
+@auth.require_user
+def return_batch():
+    data = request.get_json(silent=True)
+    user_id = g.user['user_id']
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 422
+    try:
+        borrow_ids = parse_id_list(data, 'borrow_ids')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 422
+    try:
+        # Only the caller's own loans are released; others are reported as not found
+        owned = dict(db.session.query(Borrow.id, Borrow.book_id).
+                     filter(Borrow.id.in_(borrow_ids), Borrow.user_id == user_id, Borrow.return_date.is_(None)).
+                     with_for_update().all())
+        if owned:
+            Book.query.filter(Book.id.in_(set(owned.values()))).update({Book.available: True}, synchronize_session=False)
+            Borrow.query.filter(Borrow.id.in_(list(owned))).\
+                update({Borrow.return_date: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        logger.warning(f"Return batch: contention for user {user_id}: {str(e)}")
+        return jsonify({'error': 'Books are busy, please retry'}), 503
+    if owned:
+        bump_catalog_version()
+    results = [{'borrow_id': b, 'status': 'returned' if b in owned else 'not_found'} for b in borrow_ids]
+    logger.info(f"Return batch: user {user_id} returned {len(owned)}/{len(borrow_ids)} books in one transaction")
+    return jsonify({'returned': len(owned), 'results': results}), 200
+
 @app.route('/borrowed', methods=['GET'])
+@auth.require_user
 def get_borrowed_books():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not token:
-        logger.warning("Borrowed: Missing Authorization header")
-        return jsonify({'error': 'Missing Authorization header'}), 422
-    user_id, role = get_user_id_from_token(token)
-    if not user_id:
-        logger.warning("Borrowed: Invalid token")
-        return jsonify({'error': 'Invalid token'}), 401
+    user_id = g.user['user_id']
+    etag = borrows_etag(current_catalog_version(), f'user:{user_id}')
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
     try:
-        borrowed = db.session.query(Borrow, Book).join(Book, Borrow.book_id == Book.id).filter(Borrow.user_id == user_id).all()
-        if not borrowed:
-            logger.info(f"No borrowed books for user_id={user_id}")
-            return jsonify({'borrowed_books': []}), 200
+        borrowed = db.session.query(Borrow, Book).join(Book, Borrow.book_id == Book.id).\
+            filter(Borrow.user_id == user_id, Borrow.return_date.is_(None)).all()  # Open loans only
         result = []
         for borrow, book in borrowed:
             result.append({
@@ -133,41 +328,164 @@ def get_borrowed_books():
                 'borrow_date': borrow.borrow_date.isoformat()
             })
         logger.info(f"Returning {len(result)} borrowed books for user_id={user_id}")
-        return jsonify({'borrowed_books': result}), 200
+        response = jsonify({'borrowed_books': result})
+        if etag:
+            response.set_etag(etag)
+        return response, 200
     except Exception as e:
         logger.error(f"Error querying borrowed books for user_id={user_id}: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/borrows/all', methods=['GET'])  # Admin-only: All borrows
+@auth.require_admin
 def get_all_borrows():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not token:
-        return jsonify({'error': 'Missing token'}), 401
-    _, role = get_user_id_from_token(token)
-    if role != 'admin':
-        return jsonify({'error': 'Admin access required'}), 403
     try:
-        # Join Borrow, Book, User (for username)
-        all_borrows = db.session.query(Borrow, Book, User).\
+        limit, after, filters = parse_ledger_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 422
+    etag = borrows_etag(current_catalog_version(), 'all')
+    if etag and request.if_none_match.contains(etag):
+        return not_modified(etag)
+    try:
+        # Join Borrow, Book, User (for username); filters, ordering and limit all run in SQL
+        query = db.session.query(Borrow, Book, User).\
             join(Book, Borrow.book_id == Book.id).\
             join(User, Borrow.user_id == User.id).\
-            order_by(desc(Borrow.borrow_date)).all()  # Recent first
+            filter(Borrow.return_date.is_(None))  # Open loans only
+        if 'user_id' in filters:
+            query = query.filter(Borrow.user_id == filters['user_id'])
+        if 'book_id' in filters:
+            query = query.filter(Borrow.book_id == filters['book_id'])
+        if 'from' in filters:
+            query = query.filter(Borrow.borrow_date >= filters['from'])
+        if 'to' in filters:
+            query = query.filter(Borrow.borrow_date < filters['to'])
+        if after:
+            # Seek past the last row of the previous page on (borrow_date, id), newest first
+            query = query.filter(or_(Borrow.borrow_date < after[0],
+                                     and_(Borrow.borrow_date == after[0], Borrow.id < after[1])))
+        rows = query.order_by(desc(Borrow.borrow_date), desc(Borrow.id)).limit(limit + 1).all()
+        next_cursor = ledger_cursor(rows[limit - 1][0]) if len(rows) > limit else None
         result = []
-        for borrow, book, user in all_borrows:
+        for borrow, book, user in rows[:limit]:
             result.append({
                 'borrow_id': borrow.id,
                 'user_id': borrow.user_id,
                 'username': user.username,
+                'book_id': book.id,
                 'title': book.title,
                 'author': book.author,
                 'borrow_date': borrow.borrow_date.isoformat(),
                 'available': book.available  # False if borrowed
             })
-        logger.info(f"Returning {len(result)} all borrows for admin")
-        return jsonify({'borrows': result}), 200
+        logger.info(f"Returning {len(result)} borrows for admin (filters={filters}, after={after})")
+        response = jsonify({'borrows': result, 'next_cursor': next_cursor})
+        if etag:
+            response.set_etag(etag)
+        return response, 200
     except Exception as e:
         logger.error(f"Error querying all borrows: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+BORROW_EXPORT_FIELDS = ['borrow_id', 'user_id', 'username', 'book_id', 'title', 'borrow_date', 'return_date']
+
+@app.route('/borrows/export', methods=['GET'])  # Admin-only: all borrows as streamed NDJSON/CSV
+@auth.require_admin
+def export_borrows():
+    try:
+        fmt = export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 422
+    # Live table: open loans plus returns not yet archived (the archive is served by /borrows/history)
+    query = db.session.query(Borrow.id, Borrow.user_id, User.username, Borrow.book_id, Book.title,
+                             Borrow.borrow_date, Borrow.return_date).\
+        join(Book, Borrow.book_id == Book.id).\
+        join(User, Borrow.user_id == User.id).\
+        order_by(Borrow.id)
+    logger.info(f"Streaming {fmt} borrow export for admin")
+    return export_response(query, lambda r: {
+        'borrow_id': r.id,
+        'user_id': r.user_id,
+        'username': r.username,
+        'book_id': r.book_id,
+        'title': r.title,
+        'borrow_date': r.borrow_date.isoformat(),
+        'return_date': r.return_date.isoformat() if r.return_date else None
+    }, BORROW_EXPORT_FIELDS, fmt, 'borrows')
+
+@app.route('/borrows/history', methods=['GET'])
+@auth.require_user
+def get_borrow_history():
+    user_id, role = g.user['user_id'], g.user['role']
+    target_user = request.args.get('user_id', type=int)
+    if target_user is None:
+        target_user = user_id
+    elif target_user != user_id and role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    try:
+        limit = min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), MAX_HISTORY_PAGE_SIZE)
+        after = request.args.get('after', type=int)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 422
+    # Keyset on archive id (newest first); served by idx_borrows_archive_user_id, never touches the live table
+    query = db.session.query(BorrowArchive, Book.title, Book.author).\
+        outerjoin(Book, BorrowArchive.book_id == Book.id).\
+        filter(BorrowArchive.user_id == target_user)
+    if after is not None:
+        query = query.filter(BorrowArchive.id < after)
+    rows = query.order_by(desc(BorrowArchive.id)).limit(limit + 1).all()
+    next_cursor = rows[limit - 1][0].id if len(rows) > limit else None
+    result = [{
+        'borrow_id': archived.id,
+        'book_id': archived.book_id,
+        'title': title,  # None if the book has since been deleted
+        'author': author,
+        'borrow_date': archived.borrow_date.isoformat(),
+        'return_date': archived.return_date.isoformat()
+    } for archived, title, author in rows[:limit]]
+    logger.info(f"Returning {len(result)} archived loans for user_id={target_user}")
+    return jsonify({'history': result, 'next_cursor': next_cursor}), 200
+
+def archive_closed_borrows(batch_size, cutoff):
+    # Move one batch of returned loans into borrows_archive; copy and delete commit together
+    ids = [row.id for row in db.session.query(Borrow.id).
+           filter(Borrow.return_date.isnot(None), Borrow.return_date < cutoff).
+           order_by(Borrow.return_date).limit(batch_size).all()]  # Oldest returns first, straight off idx_borrows_open_date
+    if not ids:
+        return 0
+    db.session.execute(insert(BorrowArchive).from_select(
+        ARCHIVE_COLUMNS,
+        select(Borrow.id, Borrow.user_id, Borrow.book_id, Borrow.borrow_date, Borrow.return_date).
+        where(Borrow.id.in_(ids))))
+    Borrow.query.filter(Borrow.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(ids)
+
+@app.cli.command('archive-borrows')
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True, help='Loans moved per transaction')
+@click.option('--min-age-days', default=ARCHIVE_MIN_AGE_DAYS, show_default=True, help='Only archive loans returned this long ago')
+@click.option('--interval', default=0, show_default=True, help='Seconds between runs; 0 runs once and exits')
+def archive_borrows(batch_size, min_age_days, interval):
+    """Move returned loans from borrows into borrows_archive in small batches."""
+    while True:
+        cutoff = datetime.utcnow() - timedelta(days=min_age_days)
+        total = 0
+        try:
+            while True:
+                moved = archive_closed_borrows(batch_size, cutoff)
+                total += moved
+                if moved < batch_size:
+                    break
+        except OperationalError as e:
+            # Lock wait / deadlock with live returns: whatever committed stays archived, the rest waits for the next run
+            db.session.rollback()
+            logger.warning(f"Archive: stopped early after {total} loans: {str(e)}")
+        logger.info(f"Archive: moved {total} loans returned before {cutoff.isoformat()} to borrows_archive")
+        if not interval:
+            break
+        time.sleep(interval)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5003, debug=True)
\ No newline at end of file
@@ -0,0 +1,2 @@
+# Helpers shared by the gateway and the auth, book and borrow services.
+# Service images are built from the repository root so this package is copied next to each service.
@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+import jwt
+from flask import g, jsonify, request
+from common.tracing import span
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '1024'))  # Verified tokens remembered per worker
+
+
+class TokenVerifier:
+    """Verifies HS256 JWTs and remembers the ones that passed until they expire.
+
+    Entries are keyed by the SHA-256 digest of the token (the token itself is never
+    kept) and are dropped at the token's `exp`, so a cached answer is never valid
+    for longer than jwt.decode would have accepted it.
+    """
+
+    def __init__(self, secret, max_entries=TOKEN_CACHE_SIZE):
+        self.secret = secret
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> (exp, payload)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token):
+        """Return the token's payload, or None if it is invalid or expired."""
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[digest]
+            self.misses += 1
+        try:
+            payload = jwt.decode(token, self.secret, algorithms=['HS256'])
+        except jwt.InvalidTokenError as e:  # Includes ExpiredSignatureError
+            logger.warning(f"Invalid token: {str(e)}")
+            return None
+        if isinstance(payload.get('exp'), (int, float)):  # Tokens without an expiry are verified every time
+            with self._lock:
+                self._entries[digest] = (payload['exp'], payload)
+                self._entries.move_to_end(digest)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return dict(payload)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class TokenAuth:
+    """`require_user` / `require_admin` route decorators backed by a TokenVerifier.
+
+    Both read `Authorization: Bearer <jwt>` and put the verified payload in
+    `g.user`. Status codes and the admin message are per service, so each keeps
+    the responses its clients already expect.
+    """
+
+    def __init__(self, secret, unauthorized_status=401, admin_error='Admin access required'):
+        self.verifier = TokenVerifier(secret)
+        self.unauthorized_status = unauthorized_status
+        self.admin_error = admin_error
+
+    def current_user(self):
+        # (payload, None) or (None, error response)
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            logger.warning(f"{request.endpoint}: Missing or invalid Authorization header - Returning {self.unauthorized_status}")
+            return None, (jsonify({'error': 'Missing or invalid Authorization header'}), self.unauthorized_status)
+        with span('auth'):
+            payload = self.verifier.verify(header[len('Bearer '):])
+        if not payload:
+            logger.warning(f"{request.endpoint}: Invalid or expired token - Returning {self.unauthorized_status}")
+            return None, (jsonify({'error': 'Invalid or expired token'}), self.unauthorized_status)
+        return payload, None
+
+    def require_user(self, f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            g.user, error = self.current_user()
+            if error:
+                return error
+            return f(*args, **kwargs)
+        return decorated
+
+    def require_admin(self, f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            g.user, error = self.current_user()
+            if error:
+                return error
+            if g.user.get('role') != 'admin':
+                logger.warning(f"{request.endpoint}: Non-admin request by user_id={g.user.get('user_id')} - Returning 403")
+                return jsonify({'error': self.admin_error}), 403
+            return f(*args, **kwargs)
+        return decorated
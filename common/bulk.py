@@ -0,0 +1,30 @@
+import io
+import csv
+import json
+from flask import request
+
+
+def iter_bulk_rows():
+    """Parse the request body incrementally as NDJSON (default) or CSV (Content-Type: text/csv).
+
+    Yields (line number, row dict or None, parse error or None). A body that is
+    not valid UTF-8 or CSV raises UnicodeDecodeError / csv.Error part-way through.
+    """
+    text = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    if request.mimetype == 'text/csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_no, line in enumerate(text, start=1):  # NDJSON: one JSON object per line
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f'Invalid JSON: {str(e)}'
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, 'Each line must be a JSON object'
+            continue
+        yield line_no, row, None
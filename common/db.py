@@ -0,0 +1,72 @@
+import os
+import logging
+from flask import jsonify, request
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings, per gunicorn worker. Each can be set for all services (DB_POOL_SIZE)
+# or for one (BOOK_DB_POOL_SIZE); see "Database Connection Pools" in the README for sizing.
+POOL_DEFAULTS = {
+    'POOL_SIZE': '4',  # Connections kept open
+    'MAX_OVERFLOW': '2',  # Extra connections opened under load, closed again when returned
+    'POOL_TIMEOUT': '2',  # Seconds to wait for a free connection before answering 503
+    'POOL_RECYCLE': '1800',  # Reopen connections older than this (well under MariaDB's wait_timeout)
+    'POOL_PRE_PING': '1'  # Test each connection on checkout, so one dropped while idle is replaced, not used
+}
+
+
+def database_uri():
+    # DATABASE_URL replaces the DB_* settings as a whole (the tests point it at a SQLite file)
+    return os.getenv('DATABASE_URL') or (
+        f'mysql+pymysql://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}?charset=utf8mb4'
+    )
+
+
+def pool_setting(service, name):
+    return os.getenv(f'{service}_DB_{name}', os.getenv(f'DB_{name}', POOL_DEFAULTS[name]))
+
+
+def engine_options(service):
+    """SQLALCHEMY_ENGINE_OPTIONS for one service, e.g. engine_options('BOOK')."""
+    return {
+        'pool_size': int(pool_setting(service, 'POOL_SIZE')),
+        'max_overflow': int(pool_setting(service, 'MAX_OVERFLOW')),
+        'pool_timeout': int(pool_setting(service, 'POOL_TIMEOUT')),  # Whole seconds: engine_from_config truncates fractions to int
+        'pool_recycle': int(pool_setting(service, 'POOL_RECYCLE')),
+        'pool_pre_ping': pool_setting(service, 'POOL_PRE_PING') == '1'
+    }
+
+
+def pool_stats(engine):
+    """Snapshot of this worker's pool (each gunicorn worker has its own)."""
+    pool = engine.pool
+    stats = {'pid': os.getpid(), 'pool': type(pool).__name__}
+    if hasattr(pool, 'checkedout'):  # QueuePool
+        stats.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),  # Negative while the pool has not opened all its connections yet
+            'timeout': pool.timeout(),
+            'recycle': pool._recycle,
+            'pre_ping': pool._pre_ping
+        })
+    return stats
+
+
+def init_db_pool(app, db, require_admin):
+    """Answer 503 instead of queueing when every pooled connection is busy for POOL_TIMEOUT seconds,
+    and add GET /debug/pool, wrapped in `require_admin` (e.g. TokenAuth.require_admin)."""
+
+    @app.errorhandler(PoolTimeoutError)
+    def pool_exhausted(e):
+        logger.warning(f"{request.endpoint}: No database connection free within the pool timeout - Returning 503")
+        return jsonify({'error': 'Service busy, please retry'}), 503, {'Retry-After': '1'}
+
+    @require_admin
+    def debug_pool():
+        return jsonify({'pool': pool_stats(db.engine)})
+
+    app.add_url_rule('/debug/pool', 'debug_pool', debug_pool, methods=['GET'])  # This worker's pool only
@@ -0,0 +1,53 @@
+import io
+import csv
+import json
+from flask import Response, request, stream_with_context
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+EXPORT_BATCH_SIZE = 1000  # Rows fetched per server-side cursor round trip and written per chunk
+
+
+def export_format():
+    """Read ?format= (ndjson by default); raises ValueError for anything else."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+    return fmt
+
+
+def export_response(query, serialize, fieldnames, fmt, filename, batch_size=EXPORT_BATCH_SIZE):
+    """Stream every row of `query` as NDJSON or CSV with constant memory.
+
+    The query runs with yield_per(), which uses a server-side cursor, and each
+    row is turned into a dict by `serialize` and written out one chunk per batch.
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore') if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        pending = 0
+        for row in query.yield_per(batch_size):
+            record = serialize(row)
+            if writer:
+                writer.writerow(record)
+            else:
+                buffer.write(json.dumps(record, default=str))
+                buffer.write('\n')
+            pending += 1
+            if pending >= batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+    )
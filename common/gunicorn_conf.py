@@ -0,0 +1,34 @@
+# Gunicorn settings read from the environment; flags on the gunicorn command line still win.
+# Usage: gunicorn -c common/gunicorn_conf.py --bind 0.0.0.0:5000 app:app
+import os
+import shutil
+
+# sync: one request per worker (per thread with --threads)
+# gevent: cooperative workers, each holding up to worker_connections requests that mostly wait on I/O
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.getenv('GUNICORN_THREADS', '1'))  # Above 1, sync workers become gthread workers
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+if worker_class == 'gevent':
+    # Threads are greenlets here (a few KB each), so the gateway's fan-out pool and keep-alive
+    # pools are sized for many concurrent requests instead of the sync defaults (see upstream.py)
+    os.environ.setdefault('UPSTREAM_FAN_OUT_WORKERS', str(worker_connections))
+    os.environ.setdefault('UPSTREAM_POOL_MAXSIZE', '100')
+
+
+def on_starting(server):
+    # Samples left by a previous run would be merged into /metrics as if they were current
+    metrics_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (in-progress requests, pool connections); its counters stay
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
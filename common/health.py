@@ -0,0 +1,29 @@
+import logging
+from flask import jsonify
+
+logger = logging.getLogger(__name__)
+
+
+def init_health(app, db=None):
+    """GET /healthz (the worker is serving) and GET /readyz (it can reach its database).
+
+    /healthz never touches a dependency, so a slow database does not get containers restarted;
+    /readyz is what healthchecks and rolling updates should wait for.
+    """
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({'status': 'ok'}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        if db is not None:
+            from sqlalchemy import text
+            from sqlalchemy.exc import SQLAlchemyError
+            try:
+                with db.engine.connect() as conn:  # Also leaves a checked, open connection in the pool
+                    conn.execute(text('SELECT 1'))
+            except SQLAlchemyError as e:
+                logger.warning(f"readyz: database unreachable: {str(e)} - Returning 503")
+                return jsonify({'status': 'unavailable', 'error': 'Database unreachable'}), 503
+        return jsonify({'status': 'ready'}), 200
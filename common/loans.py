@@ -0,0 +1,33 @@
+from sqlalchemy import column, delete, func, insert, select, table
+
+# borrows references books and users with RESTRICT foreign keys, and returned loans stay in it until
+# borrow-service's archive-borrows job moves them. Book and user deletes use these helpers to move a
+# row's closed loans out first; borrows_archive has no foreign keys, so the history survives the delete.
+ARCHIVE_COLUMNS = ['id', 'user_id', 'book_id', 'borrow_date', 'return_date']
+LOAN_KEYS = frozenset(['book_id', 'user_id'])
+
+borrows = table('borrows', *[column(name) for name in ARCHIVE_COLUMNS])
+borrows_archive = table('borrows_archive', *[column(name) for name in ARCHIVE_COLUMNS])
+
+
+def open_loan_count(session, key, value):
+    """Loans not returned yet for one book (key='book_id') or user (key='user_id')."""
+    if key not in LOAN_KEYS:
+        raise ValueError(f'key must be book_id or user_id, not {key}')
+    return session.execute(
+        select(func.count()).select_from(borrows).
+        where(borrows.c[key] == value, borrows.c.return_date.is_(None))
+    ).scalar()
+
+
+def archive_closed_loans(session, key, value):
+    """Move one book's or user's returned loans to borrows_archive, whatever their age.
+
+    Runs in the caller's transaction, so the move commits (or rolls back) with the delete.
+    """
+    if key not in LOAN_KEYS:
+        raise ValueError(f'key must be book_id or user_id, not {key}')
+    closed = (borrows.c[key] == value) & borrows.c.return_date.isnot(None)
+    session.execute(insert(borrows_archive).from_select(
+        ARCHIVE_COLUMNS, select(*[borrows.c[name] for name in ARCHIVE_COLUMNS]).where(closed)))
+    return session.execute(delete(borrows).where(closed)).rowcount
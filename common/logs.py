@@ -0,0 +1,158 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+
+# Logging settings (all optional environment variables)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json | text
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))  # Share of requests whose INFO/DEBUG lines are kept
+LOG_SAMPLE_ROUTES = os.getenv('LOG_SAMPLE_ROUTES', '')  # Per-endpoint overrides, e.g. "get_books=0.05,get_book=0.1"
+LOG_SLOW_MS = float(os.getenv('LOG_SLOW_MS', '1000'))  # Slower requests are always logged
+
+REDACTED = '[REDACTED]'
+REDACT_HEADERS = frozenset(['authorization', 'cookie', 'set-cookie', 'proxy-authorization', 'x-api-key'])
+BEARER_RE = re.compile(r'(Bearer\s+)[A-Za-z0-9\-_.=]+')
+
+# LogRecord attributes that are not user-supplied extras
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_route_rates(spec):
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        endpoint, _, rate = item.partition('=')
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+# Probes and scrapes are only logged when they fail (5xx) or are slow; LOG_SAMPLE_ROUTES can override
+ROUTE_SAMPLE_RATES = {'healthz': 0.0, 'readyz': 0.0, 'metrics': 0.0, **parse_route_rates(LOG_SAMPLE_ROUTES)}
+
+
+def redact_headers(headers):
+    return {key: REDACTED if key.lower() in REDACT_HEADERS else value for key, value in headers.items()}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields become top-level keys."""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'service': self.service,
+            'logger': record.name,
+            'msg': BEARER_RE.sub(r'\1' + REDACTED, record.getMessage())
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        return BEARER_RE.sub(r'\1' + REDACTED, super().format(record))
+
+
+class SampledRequestFilter(logging.Filter):
+    """Drops INFO/DEBUG records of requests that were not sampled; warnings and errors always pass.
+
+    Runs in the request's thread before the record is queued, so it also tags the record with the
+    request id (see common/tracing.py).
+    """
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        record.request_id = g.get('request_id')
+        return record.levelno >= logging.WARNING or g.get('log_sampled', True)
+
+
+_listener = None
+
+
+def _stop_listener():
+    global _listener
+    if _listener:
+        _listener.stop()  # Flushes what is still queued
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def setup_logging(service):
+    """Route all logging through a queue; a background thread formats and writes the records.
+
+    The request thread only enqueues, so slow stdout/stderr (or a busy log shipper)
+    never adds latency to a request.
+    """
+    global _listener
+    formatter = JsonFormatter(service) if LOG_FORMAT == 'json' else \
+        TextFormatter(f'%(asctime)s %(levelname)s [{service}] %(name)s: %(message)s')
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    handler = QueueHandler(log_queue)
+    handler.addFilter(SampledRequestFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    logging.getLogger('werkzeug').setLevel(max(root.level, logging.WARNING))  # Dev-server access lines duplicate ours
+    _stop_listener()
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def init_request_logging(app):
+    """One structured access line per sampled request; no header dump or body re-parse."""
+    access_logger = logging.getLogger('access')
+
+    @app.before_request
+    def start_request_log():
+        g.log_started = time.perf_counter()
+        g.log_sampled = random.random() < ROUTE_SAMPLE_RATES.get(request.endpoint, LOG_SAMPLE_RATE)
+
+    @app.after_request
+    def write_request_log(response):
+        started = g.get('log_started')
+        if started is None:
+            return response
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if response.status_code >= 500 or duration_ms >= LOG_SLOW_MS:
+            g.log_sampled = True  # Always keep errors and slow requests
+        if not g.log_sampled:
+            return response
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': duration_ms
+        }
+        spans = g.get('spans')
+        if spans:
+            fields['timings'] = {name: round(ms, 2) for name, (ms, _) in spans.items()}  # Same spans as Server-Timing
+        if access_logger.isEnabledFor(logging.DEBUG):
+            fields['headers'] = redact_headers(request.headers)
+        access_logger.info(f"{request.method} {request.path} {response.status_code} {duration_ms}ms", extra=fields)
+        return response
@@ -0,0 +1,141 @@
+import os
+import time
+from flask import Response, g, request
+from common.tracing import add_span
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+
+# Set by the images so every gunicorn worker writes its samples to files that /metrics merges;
+# unset (e.g. `flask run`), metrics are kept in the process that serves them
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)  # Also covers processes started outside gunicorn (flask CLI jobs)
+
+DB_QUERY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0)
+SQL_OPERATIONS = frozenset(['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH'])
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent serving HTTP requests',
+    ['service', 'method', 'route', 'status']
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests currently being served',
+    ['service'], multiprocess_mode='livesum'
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Time spent in SQL statements (cursor execute to result)',
+    ['service', 'operation'], buckets=DB_QUERY_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_connections_checked_out', 'Pooled DB connections currently lent to a request',
+    ['service'], multiprocess_mode='livesum'
+)
+DB_POOL_OPEN = Gauge(
+    'db_pool_connections_open', 'DB connections currently open (idle in the pool or checked out)',
+    ['service'], multiprocess_mode='livesum'
+)
+DB_POOL_SIZE = Gauge(
+    'db_pool_size', 'Configured pool size plus max overflow, per worker',
+    ['service'], multiprocess_mode='livesum'
+)
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Gateway calls to a downstream service, including retries',
+    ['target', 'method', 'status']
+)
+UPSTREAM_ERRORS = Counter(
+    'upstream_request_errors_total', 'Gateway calls that ended without a response (timeout, refused, ...)',
+    ['target', 'method', 'error']
+)
+
+
+def sql_operation(statement):
+    keyword = statement.lstrip().split(None, 1)[:1]
+    operation = keyword[0].upper() if keyword else ''
+    return operation if operation in SQL_OPERATIONS else 'OTHER'  # Bounded label values
+
+
+def instrument_engine(engine, service):
+    """Query timings and pool gauges for one SQLAlchemy engine."""
+    from sqlalchemy import event  # The gateway has no database and does not install SQLAlchemy
+    from sqlalchemy.pool import QueuePool
+    checked_out = DB_POOL_CHECKED_OUT.labels(service=service)
+    open_connections = DB_POOL_OPEN.labels(service=service)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        DB_QUERY_LATENCY.labels(service=service, operation=sql_operation(statement)).observe(elapsed)
+        add_span('db', elapsed)  # Server-Timing
+
+    @event.listens_for(engine, 'handle_error')
+    def drop_query_timer(context):
+        started = context.connection.info.get('query_started') if context.connection else None
+        if started:
+            started.pop()  # The statement failed; after_cursor_execute will not run for it
+
+    @event.listens_for(engine.pool, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        open_connections.inc()
+
+    @event.listens_for(engine.pool, 'close')
+    def on_close(dbapi_connection, connection_record):
+        open_connections.dec()
+
+    @event.listens_for(engine.pool, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine.pool, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+    if isinstance(engine.pool, QueuePool):  # sqlite and NullPool have no fixed size
+        DB_POOL_SIZE.labels(service=service).set(engine.pool.size() + max(engine.pool._max_overflow, 0))
+
+
+def metrics_response():
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # Merge every worker's files, live and dead
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, service, db=None):
+    """Add GET /metrics (Prometheus text format) and per-request latency; with `db`, also SQL timings."""
+    in_progress = REQUESTS_IN_PROGRESS.labels(service=service)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        in_progress.inc()
+
+    @app.teardown_request
+    def stop_request_timer(exc):
+        # teardown also runs for unhandled exceptions, so the in-progress gauge cannot drift
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        in_progress.dec()
+        if request.endpoint == 'metrics':
+            return
+        route = request.url_rule.rule if request.url_rule else 'unmatched'  # Templates, not raw paths: bounded labels
+        status = g.get('metrics_status', 500)
+        REQUEST_LATENCY.labels(service=service, method=request.method, route=route, status=status).observe(
+            time.perf_counter() - started)
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
+
+    if db is not None:
+        with app.app_context():
+            instrument_engine(db.engine, service)
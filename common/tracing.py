@@ -0,0 +1,113 @@
+import os
+import re
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from flask.json.provider import DefaultJSONProvider
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')  # A caller's id is only reused if it is safe to log and forward
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'  # 0 keeps the spans in the log line but off the response
+
+_spans_lock = threading.Lock()  # The gateway's fan_out threads add spans to the same request
+
+
+def current_request_id():
+    return g.get('request_id') if has_request_context() else None
+
+
+def add_span(name, seconds):
+    """Add time to the current request's `name` span; repeated spans (e.g. one per query) are summed."""
+    if not has_request_context():
+        return  # CLI jobs and pool threads outside a request
+    spans = g.get('spans')
+    if spans is None:
+        return
+    with _spans_lock:
+        entry = spans.setdefault(name, [0.0, 0])  # [milliseconds, count]
+        entry[0] += seconds * 1000
+        entry[1] += 1
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - started)
+
+
+def parse_server_timing(header):
+    # 'db;dur=3.1;desc="2 calls", total;dur=5' -> [('db', 3.1), ('total', 5.0)]
+    timings = []
+    for metric in filter(None, (part.strip() for part in (header or '').split(','))):
+        name, *params = (param.strip() for param in metric.split(';'))
+        for param in params:
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                try:
+                    timings.append((name, float(value)))
+                except ValueError:
+                    pass
+    return timings
+
+
+def merge_server_timing(prefix, header):
+    """Fold a downstream service's Server-Timing into this request's spans as `<prefix>.<name>`."""
+    for name, duration_ms in parse_server_timing(header):
+        add_span(f'{prefix}.{name}', duration_ms / 1000)
+
+
+def format_server_timing(spans):
+    return ', '.join(
+        f'{name};dur={ms:.1f}' + (f';desc="{count} calls"' if count > 1 else '')
+        for name, (ms, count) in spans.items()
+    )
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with jsonify() timed as the `serialize` span."""
+
+    def response(self, *args, **kwargs):
+        with span('serialize'):
+            return super().response(*args, **kwargs)
+
+
+def init_tracing(app):
+    """Request id (accepted from X-Request-ID or minted) and a Server-Timing header on every response.
+
+    Call after init_request_logging(app) so the spans are complete when the access line is written.
+    """
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_trace():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        g.spans = {}
+        g.trace_started = time.perf_counter()
+
+    @app.after_request
+    def finish_trace(response):
+        started = g.get('trace_started')
+        if started is None:
+            return response
+        add_span('total', time.perf_counter() - started)
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = format_server_timing(g.spans)
+        return response
+
+    def start_render(sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+
+    def stop_render(sender, template, context, **extra):
+        started = g.pop('render_started', None)
+        if started is not None:
+            add_span('render', time.perf_counter() - started)
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(stop_render, app, weak=False)
@@ -1,6 +1,9 @@
 -- Switch to the database
 USE digital_library;
 
+-- Schema for fresh volumes. Changes to existing databases go in migrations/ (applied by migrate.sh),
+-- and must also be reflected here.
+
 -- Users table (for auth)
 CREATE TABLE IF NOT EXISTS users (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -17,7 +20,9 @@ CREATE TABLE IF NOT EXISTS books (
     author_bio TEXT,
     image_url VARCHAR(500),
     book_url VARCHAR(500) NOT NULL,
-    available BOOLEAN DEFAULT TRUE
+    available BOOLEAN DEFAULT TRUE,
+    INDEX idx_books_available_id (available, id),  -- get_books keyset listing
+    FULLTEXT KEY ft_books_search (title, author, author_bio)  -- Backs /books/search
 );
 
 -- Borrows table
@@ -27,10 +32,31 @@ CREATE TABLE IF NOT EXISTS borrows (
     book_id INT NOT NULL,
     borrow_date DATETIME DEFAULT CURRENT_TIMESTAMP,
     return_date DATETIME NULL,
+    INDEX idx_borrows_user_date (user_id, borrow_date),  -- /borrowed
+    INDEX idx_borrows_borrow_date (borrow_date),  -- /borrows/all ordering
+    INDEX idx_borrows_open_date (return_date, borrow_date),  -- /borrows/all open loans, archive-borrows
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (book_id) REFERENCES books(id)
 );
 
+-- Returned loans, moved out of borrows by borrow-service's archive-borrows job
+CREATE TABLE IF NOT EXISTS borrows_archive (
+    id INT PRIMARY KEY,
+    user_id INT NOT NULL,
+    book_id INT NOT NULL,
+    borrow_date DATETIME NOT NULL,
+    return_date DATETIME NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_borrows_archive_user_id (user_id, id)  -- /borrows/history
+);
+
+-- Catalog version (single row), bumped by every write to books; services key their read caches on it
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0
+);
+INSERT IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+
 -- Insert DevOps-Related Free Books with OFFICIAL documentation links only
 INSERT IGNORE INTO books (title, author, author_bio, image_url, book_url, available) VALUES 
 
@@ -0,0 +1,56 @@
+#!/bin/bash
+# Deploy-time schema migrations for digital_library.
+#
+#   migrate.sh           apply pending migrations/*.sql in filename order, once each
+#   migrate.sh status    list applied and pending migrations
+#
+# Connection settings come from the same .env as the services (DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME).
+# Migrations must be safe to re-run (IF NOT EXISTS / INSERT IGNORE): database.sql already contains the
+# latest schema for fresh volumes, and this script then only records them as applied.
+set -euo pipefail
+
+MIGRATIONS_DIR="${MIGRATIONS_DIR:-/migrations}"
+
+db() {
+    mysql -h"${DB_HOST}" -P"${DB_PORT:-3306}" -u"${DB_USER}" -p"${DB_PASSWORD}" "${DB_NAME}" "$@"
+}
+
+echo "Waiting for MariaDB at ${DB_HOST}..."
+until mysqladmin ping -h"${DB_HOST}" -P"${DB_PORT:-3306}" -u"${DB_USER}" -p"${DB_PASSWORD}" --silent; do
+    sleep 2
+done
+
+db -e "CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(255) PRIMARY KEY,
+    applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);"
+
+is_applied() {
+    [ "$(db -N -B -e "SELECT COUNT(*) FROM schema_migrations WHERE version = '$1'")" != "0" ]
+}
+
+migrate() {
+    for file in "${MIGRATIONS_DIR}"/*.sql; do
+        version="$(basename "${file}" .sql)"
+        if is_applied "${version}"; then
+            continue
+        fi
+        echo "Applying ${version}..."
+        db < "${file}"
+        db -e "INSERT INTO schema_migrations (version) VALUES ('${version}');"
+    done
+    echo "Schema is up to date."
+}
+
+status() {
+    for file in "${MIGRATIONS_DIR}"/*.sql; do
+        version="$(basename "${file}" .sql)"
+        if is_applied "${version}"; then echo "applied  ${version}"; else echo "pending  ${version}"; fi
+    done
+}
+
+case "${1:-migrate}" in
+    migrate) migrate ;;
+    status) status ;;
+    *) echo "Usage: $0 [migrate|status]" >&2; exit 2 ;;
+esac
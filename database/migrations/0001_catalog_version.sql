@@ -0,0 +1,6 @@
+-- Single-row version counter used by book-service (read cache, ETags) and borrow-service (ETags)
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT UNSIGNED NOT NULL DEFAULT 0
+);
+INSERT IGNORE INTO catalog_version (id, version) VALUES (1, 0);
@@ -0,0 +1,2 @@
+-- Backs GET /books/search
+ALTER TABLE books ADD FULLTEXT INDEX IF NOT EXISTS ft_books_search (title, author, author_bio);
@@ -0,0 +1,8 @@
+-- book-service get_books: WHERE available = 1 AND id > ? ORDER BY id LIMIT ?
+ALTER TABLE books ADD INDEX IF NOT EXISTS idx_books_available_id (available, id), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- borrow-service /borrowed: WHERE user_id = ? (newest first); /borrows/all: ORDER BY borrow_date DESC
+ALTER TABLE borrows
+    ADD INDEX IF NOT EXISTS idx_borrows_user_date (user_id, borrow_date),
+    ADD INDEX IF NOT EXISTS idx_borrows_borrow_date (borrow_date),
+    ALGORITHM=INPLACE, LOCK=NONE;
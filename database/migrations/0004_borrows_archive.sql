@@ -0,0 +1,17 @@
+-- borrow-service now stamps borrows.return_date on return instead of deleting the row;
+-- archive-borrows moves closed loans here in batches so live queries only see open loans.
+-- Not partitioned: MariaDB partitioning needs return_date in every unique key and rules out
+-- foreign keys, and at our volumes the (user_id, id) index keeps /borrows/history cheap.
+CREATE TABLE IF NOT EXISTS borrows_archive (
+    id INT PRIMARY KEY,  -- Same id the loan had in borrows
+    user_id INT NOT NULL,
+    book_id INT NOT NULL,  -- No foreign keys: history outlives deleted books and users
+    borrow_date DATETIME NOT NULL,
+    return_date DATETIME NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_borrows_archive_user_id (user_id, id)  -- /borrows/history
+);
+
+-- archive-borrows: WHERE return_date IS NOT NULL AND return_date < ? ORDER BY id
+-- Open-loan filters (return_date IS NULL) ride on idx_borrows_user_date / idx_borrows_borrow_date
+ALTER TABLE borrows ADD INDEX IF NOT EXISTS idx_borrows_return_date (return_date), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,5 @@
+-- borrow-service /borrows/all: WHERE return_date IS NULL ORDER BY borrow_date DESC, id DESC
+-- archive-borrows: WHERE return_date IS NOT NULL AND return_date < ? ORDER BY return_date
+-- One index serves both without a filesort; it also covers every lookup idx_borrows_return_date did
+ALTER TABLE borrows ADD INDEX IF NOT EXISTS idx_borrows_open_date (return_date, borrow_date), ALGORITHM=INPLACE, LOCK=NONE;
+ALTER TABLE borrows DROP INDEX IF EXISTS idx_borrows_return_date, ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,157 @@
+import os
+import time
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# cookie: Flask's signed cookie holding just the token (no server state, any replica can serve it)
+# store:  opaque session id in the cookie, data in SESSION_STORE_URL (redis://... shared, memory:// per worker)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'cookie')
+SESSION_STORE_URL = os.getenv('SESSION_STORE_URL', 'memory://')
+SESSION_TTL = int(os.getenv('SESSION_TTL', '86400'))  # Seconds a stored session lives after its last change
+MEMORY_STORE_SIZE = int(os.getenv('SESSION_MEMORY_STORE_SIZE', '10000'))
+
+
+class MemoryStore:
+    """In-process stand-in for Redis with the same get/set/delete calls.
+
+    Each gunicorn worker has its own copy, so use it for development or a
+    single-worker gateway only.
+    """
+
+    def __init__(self, max_entries=MEMORY_STORE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisStore:
+    """Shared session store for running several gateway replicas."""
+
+    def __init__(self, url):
+        import redis  # Only needed when SESSION_STORE_URL points at Redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+def make_store(url):
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    raise ValueError(f'Unsupported SESSION_STORE_URL: {url}')
+
+
+class StoreSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class StoreSessionInterface(SessionInterface):
+    """Server-side sessions that are only written when their contents change.
+
+    The cookie carries a signed random id; a request that does not modify the
+    session causes no store write and no Set-Cookie header.
+    """
+
+    serializer = TaggedJSONSerializer()  # Same encoding as Flask's cookie sessions (keeps flash tuples intact)
+    key_prefix = 'session:'
+
+    def __init__(self, store, ttl=SESSION_TTL):
+        self.store = store
+        self.ttl = ttl
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='gateway-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self.store.get(self.key_prefix + sid)
+                if data is not None:
+                    return StoreSession(self.serializer.loads(data), sid=sid)
+        return StoreSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:  # Cleared (logout): drop the stored copy and the cookie
+                self.store.delete(self.key_prefix + session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        self.store.set(self.key_prefix + session.sid, self.serializer.dumps(dict(session)), self.ttl)
+        if session.new:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+        response.vary.add('Cookie')
+
+
+def init_sessions(app):
+    """Install the session layer selected by SESSION_BACKEND."""
+    if SESSION_BACKEND == 'cookie':
+        # Flask's default interface already skips Set-Cookie when the session is unchanged
+        logger.info("Sessions: signed cookie")
+        return
+    if SESSION_BACKEND != 'store':
+        raise ValueError(f'SESSION_BACKEND must be cookie or store, not {SESSION_BACKEND}')
+    app.session_interface = StoreSessionInterface(make_store(SESSION_STORE_URL))
+    logger.info(f"Sessions: server-side store at {SESSION_STORE_URL.split('@')[-1]}")  # No credentials in logs
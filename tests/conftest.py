@@ -0,0 +1,114 @@
+"""Shared fixtures: the three services against one SQLite file, with the schema of database/database.sql.
+
+Settings are environment variables read when a service module is imported, so they are set here,
+before any test imports one.
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import importlib
+import pytest
+from sqlalchemy import event
+
+from helpers import JWT_SECRET, ROOT
+
+sys.path[:0] = [ROOT] + [os.path.join(ROOT, service) for service in ('auth', 'book', 'borrow')]
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='library-tests-'), 'library.db')
+
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ['JWT_SECRET'] = JWT_SECRET
+os.environ['BCRYPT_ROUNDS'] = '4'  # Cheapest cost bcrypt accepts
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+# database/database.sql in SQLite syntax (no FULLTEXT, so /books/search is not covered)
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(80) UNIQUE NOT NULL COLLATE NOCASE,
+    password_hash VARCHAR(120) NOT NULL,
+    role VARCHAR(20) DEFAULT 'user'
+);
+CREATE TABLE books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(200) NOT NULL,
+    author VARCHAR(100) NOT NULL,
+    author_bio TEXT,
+    image_url VARCHAR(500),
+    book_url VARCHAR(500) NOT NULL,
+    available BOOLEAN DEFAULT 1
+);
+CREATE TABLE borrows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL REFERENCES users(id),
+    book_id INT NOT NULL REFERENCES books(id),
+    borrow_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+    return_date DATETIME NULL
+);
+CREATE TABLE borrows_archive (
+    id INT PRIMARY KEY,
+    user_id INT NOT NULL,
+    book_id INT NOT NULL,
+    borrow_date DATETIME NOT NULL,
+    return_date DATETIME NOT NULL,
+    archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE catalog_version (
+    id TINYINT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_version (id, version) VALUES (1, 0);
+"""
+
+with sqlite3.connect(DB_PATH) as conn:
+    conn.executescript(SCHEMA)
+
+
+def load_service(name):
+    """Import a service module once, with foreign keys enforced like MariaDB's (RESTRICT)."""
+    module = importlib.import_module(name)
+    if not getattr(module, '_tests_prepared', False):
+        with module.app.app_context():
+            @event.listens_for(module.db.engine, 'connect')
+            def enforce_foreign_keys(dbapi_connection, connection_record):
+                dbapi_connection.execute('PRAGMA foreign_keys = ON')
+                dbapi_connection.execute('PRAGMA busy_timeout = 5000')
+        module._tests_prepared = True
+    return module
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    # Empty every table; the catalog version keeps counting up so no per-worker cache outlives a test
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.executescript(
+            'DELETE FROM borrows; DELETE FROM borrows_archive; DELETE FROM books; DELETE FROM users;'
+            'UPDATE catalog_version SET version = version + 1;'
+        )
+    yield
+
+
+@pytest.fixture
+def db_conn():
+    """A plain sqlite3 connection to the test database, for seeding rows and checking results."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute('PRAGMA foreign_keys = ON')
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def book_service():
+    return load_service('book_service')
+
+
+@pytest.fixture
+def borrow_service():
+    return load_service('borrow_service')
+
+
+@pytest.fixture
+def auth_service():
+    return load_service('auth_service')
+
@@ -0,0 +1,70 @@
+"""Tokens, seed rows and a gunicorn runner for the tests (fixtures are in conftest.py)."""
+import os
+import sys
+import time
+import socket
+import subprocess
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import jwt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JWT_SECRET = 'test-secret'
+
+
+def auth_header(user_id=1, role='admin', username='admin'):
+    token = jwt.encode({'user_id': user_id, 'username': username, 'role': role,
+                        'exp': datetime.utcnow() + timedelta(hours=1)}, JWT_SECRET, algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def add_user(conn, username='reader', role='user'):
+    cursor = conn.execute('INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)', (username, 'x', role))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def add_book(conn, title='Pro Git', available=True):
+    cursor = conn.execute('INSERT INTO books (title, author, book_url, available) VALUES (?, ?, ?, ?)',
+                          (title, 'Scott Chacon', 'https://git-scm.com/book', int(available)))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def gunicorn_server(app, cwd, **env):
+    """Serve `app` (e.g. 'book_service:app') with common/gunicorn_conf.py; yields the base URL.
+
+    Keyword arguments are added to the environment, e.g. GUNICORN_THREADS='4'.
+    """
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'common', 'gunicorn_conf.py'),
+         '--bind', f'127.0.0.1:{port}', '--workers', '1', app],
+        cwd=cwd, env=dict(os.environ, PYTHONPATH=ROOT, **env),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                urllib.request.urlopen(f'{base_url}/healthz', timeout=1).close()
+                break
+            except urllib.error.HTTPError:
+                break  # Serving, even if the app has no /healthz
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError(f'{app} did not start under gunicorn')
+                time.sleep(0.2)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
@@ -0,0 +1,28 @@
+import pytest
+
+from helpers import add_user, auth_header
+
+NOT_OBJECTS = [[1, 2], 'books', 7, None]
+
+
+@pytest.mark.parametrize('path', ['/borrow/batch', '/return/batch'])
+@pytest.mark.parametrize('body', NOT_OBJECTS)
+def test_batch_body_must_be_an_object(borrow_service, db_conn, path, body):
+    user_id = add_user(db_conn)
+    client = borrow_service.app.test_client()
+    headers = auth_header(user_id=user_id, role='user', username='reader')
+
+    response = client.post(path, json=body, headers=headers)
+
+    assert response.status_code == 422
+    assert response.get_json() == {'error': 'Request body must be a JSON object'}
+
+
+def test_borrow_batch_for_another_user_is_refused(borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    headers = auth_header(user_id=user_id, role='user', username='reader')
+
+    response = borrow_service.app.test_client().post('/borrow/batch', json={'user_id': user_id + 1, 'book_ids': [1]},
+                                                     headers=headers)
+
+    assert response.status_code == 403
@@ -0,0 +1,58 @@
+import threading
+from collections import Counter
+
+from helpers import add_book, add_user, auth_header
+
+CLIENTS = 16
+RETURNS = 8
+
+
+def test_concurrent_borrows_of_one_book(borrow_service, db_conn):
+    book_id = add_book(db_conn)
+    user_ids = [add_user(db_conn, username=f'reader{i}') for i in range(CLIENTS)]
+    start = threading.Barrier(CLIENTS)
+    statuses = []
+
+    def borrow(user_id):
+        client = borrow_service.app.test_client()
+        headers = auth_header(user_id=user_id, role='user', username=f'reader{user_id}')
+        start.wait()  # Release every request at once
+        response = client.post('/borrow', json={'user_id': user_id, 'book_id': book_id}, headers=headers)
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=borrow, args=(user_id,)) for user_id in user_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    counts = Counter(statuses)
+    assert counts[201] == 1
+    assert set(counts) <= {201, 409, 503}  # Losers are told the book is taken, or to retry
+    assert db_conn.execute('SELECT COUNT(*) FROM borrows WHERE book_id = ?', (book_id,)).fetchone()[0] == 1
+    assert db_conn.execute('SELECT available FROM books WHERE id = ?', (book_id,)).fetchone()[0] == 0
+
+
+def test_concurrent_returns_of_one_loan(borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn, available=False)
+    borrow_id = db_conn.execute('INSERT INTO borrows (user_id, book_id) VALUES (?, ?)', (user_id, book_id)).lastrowid
+    db_conn.commit()
+    headers = auth_header(user_id=user_id, role='user', username='reader')
+    start = threading.Barrier(RETURNS)
+    statuses = []
+
+    def return_loan():
+        client = borrow_service.app.test_client()
+        start.wait()
+        statuses.append(client.post(f'/return/{borrow_id}', headers=headers).status_code)
+
+    threads = [threading.Thread(target=return_loan) for _ in range(RETURNS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert Counter(statuses) == {200: 1, 404: RETURNS - 1}  # Only one return closes the loan
+    assert db_conn.execute('SELECT COUNT(*) FROM borrows WHERE id = ? AND return_date IS NOT NULL', (borrow_id,)).fetchone()[0] == 1
+    assert db_conn.execute('SELECT available FROM books WHERE id = ?', (book_id,)).fetchone()[0] == 1
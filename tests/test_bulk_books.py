@@ -0,0 +1,35 @@
+import json
+import pytest
+
+from helpers import auth_header
+
+
+@pytest.fixture
+def reject_title(db_conn):
+    # Stands in for a constraint the batch INSERT can hit (a unique key, a CHECK) on one row only
+    db_conn.execute("CREATE TRIGGER reject_title BEFORE INSERT ON books WHEN NEW.title = 'Rejected' "
+                    "BEGIN SELECT RAISE(ABORT, 'title not allowed'); END")
+    db_conn.commit()
+    yield 'Rejected'
+    db_conn.execute('DROP TRIGGER reject_title')
+    db_conn.commit()
+
+
+def ndjson(titles):
+    return '\n'.join(json.dumps({'title': t, 'author': 'Author', 'book_url': 'https://example.org'}) for t in titles)
+
+
+def test_rejected_row_does_not_fail_its_batch(book_service, db_conn, reject_title):
+    body = ndjson(['First', reject_title, 'Third', 'Fourth'])
+
+    response = book_service.app.test_client().post('/books/bulk?batch_size=10', data=body,
+                                                   content_type='application/x-ndjson', headers=auth_header())
+
+    report = response.get_json()
+    assert response.status_code == 200
+    assert report['inserted'] == 3
+    assert report['failed'] == 1
+    assert [e['line'] for e in report['errors']] == [2]
+    assert 'title not allowed' in report['errors'][0]['error']
+    titles = [t for (t,) in db_conn.execute('SELECT title FROM books ORDER BY id')]
+    assert titles == ['First', 'Third', 'Fourth']
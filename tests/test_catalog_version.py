@@ -0,0 +1,38 @@
+from helpers import add_book, add_user, auth_header
+
+
+def listed_ids(client):
+    response = client.get('/books', headers=auth_header(role='user'))
+    assert response.status_code == 200
+    return [book['id'] for book in response.get_json()['books']]
+
+
+def test_borrow_and_return_refresh_cached_listing(book_service, borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn)
+    books = book_service.app.test_client()
+    borrows = borrow_service.app.test_client()
+    headers = auth_header(user_id=user_id, role='user', username='reader')
+    version = db_conn.execute('SELECT version FROM catalog_version').fetchone()[0]
+
+    assert listed_ids(books) == [book_id]  # Now cached under the current version
+    response = borrows.post('/borrow', json={'user_id': user_id, 'book_id': book_id}, headers=headers)
+    assert response.status_code == 201
+    assert listed_ids(books) == []
+
+    assert borrows.post(f"/return/{response.get_json()['borrow_id']}", headers=headers).status_code == 200
+    assert listed_ids(books) == [book_id]
+    assert db_conn.execute('SELECT version FROM catalog_version').fetchone()[0] == version + 2
+
+
+def test_failed_borrow_does_not_bump(borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn, available=False)
+    version = db_conn.execute('SELECT version FROM catalog_version').fetchone()[0]
+
+    response = borrow_service.app.test_client().post(
+        '/borrow', json={'user_id': user_id, 'book_id': book_id},
+        headers=auth_header(user_id=user_id, role='user', username='reader'))
+
+    assert response.status_code == 409
+    assert db_conn.execute('SELECT version FROM catalog_version').fetchone()[0] == version
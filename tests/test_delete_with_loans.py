@@ -0,0 +1,58 @@
+from helpers import add_book, add_user, auth_header
+
+
+def borrow_and_return(borrow_service, user_id, book_id, returned=True):
+    client = borrow_service.app.test_client()
+    headers = auth_header(user_id=user_id, role='user', username='reader')
+    response = client.post('/borrow', json={'user_id': user_id, 'book_id': book_id}, headers=headers)
+    assert response.status_code == 201
+    if returned:
+        borrow_id = response.get_json()['borrow_id']
+        assert client.post(f'/return/{borrow_id}', headers=headers).status_code == 200
+
+
+def test_delete_book_after_it_was_returned(book_service, borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn)
+    borrow_and_return(borrow_service, user_id, book_id)
+
+    response = book_service.app.test_client().delete(f'/books/{book_id}', headers=auth_header())
+
+    assert response.status_code == 200
+    assert db_conn.execute('SELECT COUNT(*) FROM books WHERE id = ?', (book_id,)).fetchone()[0] == 0
+    assert db_conn.execute('SELECT COUNT(*) FROM borrows').fetchone()[0] == 0
+    assert db_conn.execute('SELECT book_id, user_id FROM borrows_archive').fetchall() == [(book_id, user_id)]
+
+
+def test_delete_book_on_loan_is_refused(book_service, borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn)
+    borrow_and_return(borrow_service, user_id, book_id, returned=False)
+
+    response = book_service.app.test_client().delete(f'/books/{book_id}', headers=auth_header())
+
+    assert response.status_code == 409
+    assert db_conn.execute('SELECT COUNT(*) FROM borrows').fetchone()[0] == 1
+
+
+def test_delete_user_after_returning(auth_service, borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn)
+    borrow_and_return(borrow_service, user_id, book_id)
+
+    response = auth_service.app.test_client().delete(f'/users/{user_id}', headers=auth_header(user_id=999))
+
+    assert response.status_code == 200
+    assert db_conn.execute('SELECT COUNT(*) FROM users WHERE id = ?', (user_id,)).fetchone()[0] == 0
+    assert db_conn.execute('SELECT user_id FROM borrows_archive').fetchall() == [(user_id,)]
+
+
+def test_delete_user_with_open_loan_is_refused(auth_service, borrow_service, db_conn):
+    user_id = add_user(db_conn)
+    book_id = add_book(db_conn)
+    borrow_and_return(borrow_service, user_id, book_id, returned=False)
+
+    response = auth_service.app.test_client().delete(f'/users/{user_id}', headers=auth_header(user_id=999))
+
+    assert response.status_code == 409
+    assert db_conn.execute('SELECT COUNT(*) FROM users WHERE id = ?', (user_id,)).fetchone()[0] == 1
@@ -0,0 +1,50 @@
+import http.client
+import urllib.request
+import pytest
+
+from helpers import gunicorn_server
+
+pytest.importorskip('gunicorn')
+
+ROWS = 8
+ROW_DELAY = 0.5  # The whole export takes 4s, four times GUNICORN_TIMEOUT
+
+SLOW_EXPORT_APP = f"""
+import time
+from flask import Flask
+from common.export import export_response
+
+class SlowQuery:
+    # Stands in for a large table: one row every {ROW_DELAY}s through the real export_response()
+    def yield_per(self, batch_size):
+        for i in range({ROWS}):
+            time.sleep({ROW_DELAY})
+            yield {{'id': i}}
+
+app = Flask(__name__)
+
+@app.route('/export')
+def export():
+    return export_response(SlowQuery(), dict, ['id'], 'ndjson', 'slow', batch_size=1)
+"""
+
+
+def exported_lines(tmp_path, threads):
+    (tmp_path / 'slow_export_app.py').write_text(SLOW_EXPORT_APP)
+    with gunicorn_server('slow_export_app:app', str(tmp_path), GUNICORN_THREADS=str(threads), GUNICORN_TIMEOUT='1') as base_url:
+        try:
+            with urllib.request.urlopen(f'{base_url}/export', timeout=30) as response:
+                return response.read().decode().splitlines()
+        except (OSError, http.client.HTTPException):
+            return None  # Connection dropped: the worker was killed mid-stream
+
+
+def test_threaded_worker_streams_past_the_timeout(tmp_path):
+    lines = exported_lines(tmp_path, threads=4)
+    assert lines is not None and len(lines) == ROWS
+
+
+def test_sync_worker_is_killed_mid_stream(tmp_path):
+    # Why the service images run threaded workers: GUNICORN_TIMEOUT bounds a whole sync request
+    lines = exported_lines(tmp_path, threads=1)
+    assert lines is None or len(lines) < ROWS
@@ -0,0 +1,45 @@
+import os
+import pytest
+
+from helpers import ROOT, gunicorn_server
+
+pytest.importorskip('gunicorn')
+pytest.importorskip('requests')  # upstream.py
+
+REQUESTS = 5
+
+
+@pytest.fixture
+def book_server(request):
+    """book-service under gunicorn with GUNICORN_THREADS=request.param."""
+    with gunicorn_server('book_service:app', os.path.join(ROOT, 'book'), GUNICORN_THREADS=str(request.param)) as base_url:
+        yield base_url
+
+
+def connections_opened(base_url, monkeypatch):
+    # The gateway's client (upstream.py) makes REQUESTS calls; count the TCP connects underneath them
+    import urllib3.connection
+    from upstream import UpstreamClient
+    connects = []
+    create_connection = urllib3.connection.connection.create_connection
+
+    def counting_create_connection(*args, **kwargs):
+        connects.append(args[0])
+        return create_connection(*args, **kwargs)
+
+    monkeypatch.setattr(urllib3.connection.connection, 'create_connection', counting_create_connection)
+    client = UpstreamClient('book', base_url)
+    for _ in range(REQUESTS):
+        assert client.request('GET', '/healthz').status_code == 200
+    return len(connects)
+
+
+@pytest.mark.parametrize('book_server', [4], indirect=True)
+def test_threaded_workers_keep_upstream_connections_alive(book_server, monkeypatch):
+    assert connections_opened(book_server, monkeypatch) == 1
+
+
+@pytest.mark.parametrize('book_server', [1], indirect=True)
+def test_sync_workers_close_every_connection(book_server, monkeypatch):
+    # Why the images set GUNICORN_THREADS: a plain sync worker answers `Connection: close`
+    assert connections_opened(book_server, monkeypatch) == REQUESTS
@@ -0,0 +1,168 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common.metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY
+from common.tracing import REQUEST_ID_HEADER, add_span, current_request_id, merge_server_timing
+
+logger = logging.getLogger(__name__)
+
+# Connection pool / timeout / retry settings for gateway -> service calls
+POOL_CONNECTIONS = int(os.getenv('UPSTREAM_POOL_CONNECTIONS', '4'))  # Host pools kept per upstream
+POOL_MAXSIZE = int(os.getenv('UPSTREAM_POOL_MAXSIZE', '10'))  # Keep-alive connections per host
+CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '10'))
+MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+RETRY_BACKOFF = float(os.getenv('UPSTREAM_RETRY_BACKOFF', '0.2'))
+FAN_OUT_WORKERS = int(os.getenv('UPSTREAM_FAN_OUT_WORKERS', '8'))  # Threads per worker for concurrent calls
+ETAG_CACHE_SIZE = int(os.getenv('UPSTREAM_ETAG_CACHE_SIZE', '256'))  # Revalidatable responses kept per upstream
+FAN_OUT_DEADLINE = float(os.getenv('UPSTREAM_FAN_OUT_DEADLINE', str(READ_TIMEOUT)))  # Overall budget per page
+
+# Only these are retried after the request reached the service; connect errors are retried for any method
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client for one downstream service.
+
+    Each gunicorn worker lazily builds its own requests.Session (pid-checked, so
+    nothing is shared across a fork) with a pooled adapter and bounded retries.
+    """
+
+    def __init__(self, name, base_url):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self._session = None
+        self._pid = None
+        self._etag_cache = OrderedDict()  # (scope, path, params) -> (etag, parsed body)
+        self._etag_lock = threading.Lock()
+
+    def _build_session(self):
+        retry = Retry(
+            total=MAX_RETRIES,
+            connect=MAX_RETRIES,
+            read=MAX_RETRIES,
+            status=MAX_RETRIES,
+            backoff_factor=RETRY_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False  # Hand the last response back so callers keep using raise_for_status()
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        logger.debug(f"Upstream pool for {self.name} created (pool_maxsize={POOL_MAXSIZE}, retries={MAX_RETRIES})")
+        return session
+
+    @property
+    def session(self):
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            self._session = self._build_session()
+            self._pid = pid
+        return self._session
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+        request_id = current_request_id()
+        if request_id:
+            kwargs['headers'] = {REQUEST_ID_HEADER: request_id, **(kwargs.get('headers') or {})}
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+        except requests.exceptions.RequestException as e:
+            UPSTREAM_ERRORS.labels(target=self.name, method=method, error=type(e).__name__).inc()
+            raise
+        elapsed = time.perf_counter() - started
+        UPSTREAM_LATENCY.labels(target=self.name, method=method, status=response.status_code).observe(elapsed)
+        add_span(self.name, elapsed)
+        merge_server_timing(self.name, response.headers.get('Server-Timing'))  # e.g. book-service.db
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def get_json(self, path, cache_scope=None, params=None, headers=None, **kwargs):
+        """GET a JSON body, revalidating a cached copy with If-None-Match.
+
+        `cache_scope` (e.g. the user id) keeps one user's responses from being
+        served to another. Raises requests.HTTPError on an error status.
+        """
+        key = (cache_scope, path, tuple(sorted((params or {}).items())))
+        headers = dict(headers or {})
+        with self._etag_lock:
+            cached = self._etag_cache.get(key)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        response = self.get(path, params=params, headers=headers, **kwargs)
+        if response.status_code == 304 and cached:
+            with self._etag_lock:
+                if key in self._etag_cache:
+                    self._etag_cache.move_to_end(key)
+            return cached[1]
+        response.raise_for_status()
+        data = response.json()
+        etag = response.headers.get('ETag')  # Kept quoted, exactly as it must be sent back
+        if etag:
+            with self._etag_lock:
+                self._etag_cache[key] = (etag, data)
+                self._etag_cache.move_to_end(key)
+                while len(self._etag_cache) > ETAG_CACHE_SIZE:
+                    self._etag_cache.popitem(last=False)
+        return data
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+
+class UpstreamDeadlineExceeded(requests.exceptions.Timeout):
+    """A fanned-out call was still running when the overall deadline passed."""
+
+
+_executor = None
+_executor_pid = None
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        _executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix='fan-out')
+        _executor_pid = pid
+    return _executor
+
+
+def fan_out(calls, deadline=FAN_OUT_DEADLINE):
+    """Run independent upstream calls concurrently under one overall deadline.
+
+    `calls` maps a name to a zero-argument callable. Returns a dict with the same
+    keys holding either the callable's return value or the exception it raised
+    (UpstreamDeadlineExceeded if it did not finish in time), so one failing
+    service only blanks its own part of the page.
+    """
+    # Each call runs in a copy of the caller's context, so the request (g, request id, spans) is visible in the thread
+    futures = {name: _get_executor().submit(contextvars.copy_context().run, fn) for name, fn in calls.items()}
+    done, _ = wait(futures.values(), timeout=deadline)
+    results = {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            results[name] = UpstreamDeadlineExceeded(f'{name} did not respond within {deadline}s')
+        elif future.exception() is not None:
+            results[name] = future.exception()
+        else:
+            results[name] = future.result()
+    return results